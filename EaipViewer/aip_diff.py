@@ -0,0 +1,213 @@
+import argparse
+import json
+from aip_index import AipIndex
+from aip_node import compact_records
+from chart_downloader import chart_url
+
+
+class AipDiff:
+    """两个AIRAC版本AIP目录的结构化对比
+
+    只比较带pdfPath的节点。先按id配对，剩余节点再依次按航图编号（如 ZYYJ-20B）
+    和pdfPath中的文件哈希配对，全程基于字典查找，复杂度与节点数成线性。
+    每个变化记为 added / removed / renamed / reissued（同一节点可同时改名和重新发布）。
+    """
+
+    KINDS = ('added', 'removed', 'renamed', 'reissued')
+    OTHER = 'GEN/ENR'  # 不属于任何机场的节点
+
+    def __init__(self, old, new, old_package=None, new_package=None):
+        self.old = self._as_index(old)
+        self.new = self._as_index(new)
+        self.old_package = old_package
+        self.new_package = new_package
+        self.changes = []
+
+    @staticmethod
+    def _as_index(data):
+        if isinstance(data, AipIndex):
+            return data
+        if isinstance(data, dict):
+            data = [data]
+        return AipIndex(compact_records(data or []))
+
+    @staticmethod
+    def chart_code(node):
+        """提取航图编号（如 ZYYJ-20B），非航图节点返回None"""
+        return AipIndex.chart_code(node)
+
+    @staticmethod
+    def pdf_key(pdf_path):
+        """去掉版本目录后的pdfPath，如 Terminal/ZJHK/034797bf....pdf
+
+        文件名是内容哈希，版本间该值不变说明航图未重新发布。
+        """
+        if not pdf_path:
+            return ''
+        parts = pdf_path.strip('/').split('/', 2)
+        return parts[-1].lower()
+
+    @staticmethod
+    def _airport_lookup(index):
+        """返回 节点id -> ICAO 的查询函数（沿祖先链查找机场节点）"""
+        airport_ids = {node_id: icao for icao, node_id in index.icao_map.items()}
+
+        def lookup(node_id):
+            for ancestor in reversed(index.path_ids(node_id)):
+                icao = airport_ids.get(ancestor)
+                if icao:
+                    return icao
+            return AipDiff.OTHER
+        return lookup
+
+    @staticmethod
+    def _unique_map(nodes, key_func):
+        """建立 键 -> 节点 的映射，重复的键不参与配对"""
+        mapping = {}
+        duplicated = set()
+        for node in nodes:
+            key = key_func(node)
+            if not key or key in duplicated:
+                continue
+            if key in mapping:
+                del mapping[key]
+                duplicated.add(key)
+            else:
+                mapping[key] = node
+        return mapping
+
+    def _match(self):
+        """按 id -> 航图编号 -> pdf哈希 的顺序配对，返回 (配对列表, 旧版剩余, 新版剩余)"""
+        old_charts = {node['id']: node for node in self.old if node.get('pdfPath')}
+        new_charts = {node['id']: node for node in self.new if node.get('pdfPath')}
+
+        pairs = []
+        for node_id, node in new_charts.items():
+            old_node = old_charts.get(node_id)
+            if old_node is not None:
+                pairs.append((old_node, node))
+        matched_old = {old['id'] for old, _ in pairs}
+        rest_old = [node for node_id, node in old_charts.items() if node_id not in matched_old]
+        rest_new = [node for node_id, node in new_charts.items() if node_id not in old_charts]
+
+        for key_func in (self.chart_code, lambda node: self.pdf_key(node.get('pdfPath'))):
+            old_map = self._unique_map(rest_old, key_func)
+            new_map = self._unique_map(rest_new, key_func)
+            paired = set()
+            for key, node in new_map.items():
+                old_node = old_map.get(key)
+                if old_node is not None:
+                    pairs.append((old_node, node))
+                    paired.add(old_node['id'])
+                    paired.add(node['id'])
+            rest_old = [node for node in rest_old if node['id'] not in paired]
+            rest_new = [node for node in rest_new if node['id'] not in paired]
+        return pairs, rest_old, rest_new
+
+    def compare(self):
+        """执行对比，返回变化列表"""
+        old_airport = self._airport_lookup(self.old)
+        new_airport = self._airport_lookup(self.new)
+        changes = []
+
+        pairs, removed, added = self._match()
+        for old_node, node in pairs:
+            kinds = []
+            if (old_node.get('name_cn') or '') != (node.get('name_cn') or ''):
+                kinds.append('renamed')
+            if self.pdf_key(old_node.get('pdfPath')) != self.pdf_key(node.get('pdfPath')):
+                kinds.append('reissued')
+            if kinds:
+                changes.append(self._entry(kinds, node, new_airport(node['id']), old_node))
+        for node in added:
+            changes.append(self._entry(['added'], node, new_airport(node['id'])))
+        for node in removed:
+            changes.append(self._entry(['removed'], node, old_airport(node['id'])))
+
+        changes.sort(key=lambda c: (c['icao'], c['code'] or '', c['name_cn']))
+        self.changes = changes
+        return changes
+
+    def _entry(self, kinds, node, icao, old_node=None):
+        entry = {
+            'changes': kinds,
+            'icao': icao,
+            'code': self.chart_code(node),
+            'id': node['id'],
+            'name_cn': node.get('name_cn') or '',
+            'pdfPath': node.get('pdfPath') or '',
+            'is_modified': node.get('Is_Modified') == 'Y',
+        }
+        if old_node is not None:
+            entry['old_id'] = old_node['id']
+            entry['old_name_cn'] = old_node.get('name_cn') or ''
+            entry['old_pdfPath'] = old_node.get('pdfPath') or ''
+        return entry
+
+    def summary(self):
+        """按机场汇总各类变化的数量"""
+        result = {}
+        for change in self.changes:
+            counts = result.setdefault(change['icao'], dict.fromkeys(self.KINDS, 0))
+            for kind in change['changes']:
+                counts[kind] += 1
+        return result
+
+    def to_dict(self):
+        def package_name(pkg):
+            return pkg.get('dataName') if pkg else None
+        return {
+            'old': package_name(self.old_package),
+            'new': package_name(self.new_package),
+            'changes': self.changes,
+            'summary': self.summary(),
+        }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def download_tasks(self):
+        """新增和重新发布的航图，返回 (名称, URL, 是否修改) 列表，可直接交给AiracSync.sync"""
+        tasks = {}
+        for change in self.changes:
+            if 'added' in change['changes'] or 'reissued' in change['changes']:
+                url = chart_url(self.new_package, change['pdfPath'])
+                if url and url not in tasks:
+                    tasks[url] = (change['name_cn'], url, True)
+        return list(tasks.values())
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            print("两个版本的航图没有变化")
+            return
+        print(f"{'机场':<10}" + ''.join(f"{kind:>10}" for kind in self.KINDS))
+        for icao in sorted(summary):
+            counts = summary[icao]
+            print(f"{icao:<10}" + ''.join(f"{counts[kind]:>10}" for kind in self.KINDS))
+        totals = {kind: sum(c[kind] for c in summary.values()) for kind in self.KINDS}
+        print(f"{'合计':<10}" + ''.join(f"{totals[kind]:>10}" for kind in self.KINDS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两个版本的AIP.JSON")
+    parser.add_argument('old', help="旧版本AIP.JSON")
+    parser.add_argument('new', help="新版本AIP.JSON")
+    parser.add_argument('--output', default=None, metavar='PATH', help="将变化集写入JSON文件")
+    args = parser.parse_args()
+
+    with open(args.old, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+    diff = AipDiff(old, new)
+    diff.compare()
+    diff.print_summary()
+    if args.output:
+        diff.save(args.output)
+        print(f"变化集已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
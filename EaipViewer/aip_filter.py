@@ -1,54 +1,63 @@
-import re
 import os
+from aip_index import AipIndex
+from aip_node import is_record
+from chart_downloader import chart_url
+from filter_rules import FilterRules
+from instrumentation import metrics
 
 class AipFilter:
     @staticmethod
-    def filter_content(aip_json, package_info=None):
-        """过滤AIP目录内容"""
+    @metrics.timed('filter_content')
+    def filter_content(aip_json, package_info=None, rules=None, save_paths=True, manifest=None):
+        """过滤AIP目录内容
+
+        aip_json可以是原始数据，也可以是已建立好的AipIndex。
+        rules为FilterRules实例，未指定时使用默认的 ENR 6 / AD 2 / ICAO / 航图编号 规则。
+        manifest为ChartManifest时，命中的航图逐条写入结构化清单。
+        """
         if not aip_json:
             print("没有获取到AIP数据")
             return []
             
-        if not isinstance(aip_json, (list, dict)):
+        if not isinstance(aip_json, (list, dict, AipIndex)):
             print(f"无效的AIP数据格式: {type(aip_json)}")
             return []
             
         try:
             filtered = []
             pdf_paths = []  # 用于存储所有PDF路径
+            writer = manifest.writer(package_info) if manifest is not None else None
             
             if isinstance(aip_json, dict):
                 aip_json = [aip_json]
+
+            if rules is None:
+                rules = FilterRules()
+            rules.reset_hits()
+
+            # 真实的AIP.JSON是id/pId关联的扁平列表，先建立索引还原层级
+            if isinstance(aip_json, AipIndex):
+                index = aip_json
+            else:
+                index = AipIndex(aip_json) if AipIndex.is_flat(aip_json) else None
+            if index is not None:
+                aip_json = index.roots()
+
+            def get_children(item):
+                if index is not None:
+                    return index.children(item.get('id'))
+                return item.get('children', [])
             
-            def should_keep_item(name_cn, full_path=[]):
-                # 检查ENR章节
-                if "ENR 6" in str(name_cn):
-                    return True
-                    
-                # 检查是否为AD 2机场清单
-                if "AD 2 机场清单" in str(name_cn):
-                    return True
-                    
-                # 检查是否为机场ICAO代码开头的章节
-                if re.match(r'Z[PBGHLSUWY][A-Z]{2}', str(name_cn)):
-                    return True
-                    
-                # 如果是航图部分，总是保留父级目录下的所有内容
-                parent_is_chart = any('机场清单' in p for p in full_path)
-                if parent_is_chart and re.match(r'Z[PBGHLSUWY][A-Z]{2}-\d[A-Z]?\d?\d?', str(name_cn)):
-                    return True
-                
-                return False
-            
-            def process_item(item, path=[]):
-                if not isinstance(item, dict):
+            def process_item(item, flags=frozenset(), icao=None):
+                if not is_record(item):
                     return None
                 
                 name_cn = item.get('name_cn', '')
-                current_path = path + [name_cn]
+                icao = AipIndex.node_icao(item) or icao
                 
-                # 检查是否需要保留该项目
-                keep_item = should_keep_item(name_cn, current_path)
+                # 检查是否需要保留该项目，祖先标记随flags向下继承
+                matched_rule, child_flags = rules.evaluate(name_cn, flags)
+                keep_item = matched_rule is not None
                 
                 if keep_item:
                     processed_item = {
@@ -59,27 +68,27 @@ class AipFilter:
                     
                     # 如果需要保留且有PDF路径，则构建完整URL
                     pdf_path = item.get('pdfPath', '')
-                    if pdf_path and package_info:
-                        base_path = package_info["filePath"]
-                        version = package_info.get("dataName", "").replace(" ", "")
-                        full_url = f"https://www.eaipchina.cn/eaip/{base_path}/{pdf_path.split('/', 3)[-1] if '/' in pdf_path else pdf_path}"
+                    full_url = chart_url(package_info, pdf_path)
+                    if full_url:
                         pdf_paths.append(f"{name_cn}: {full_url}")
+                        if writer is not None:
+                            writer.add(item, icao, full_url)
                     
                     # 处理子节点
-                    children = item.get('children', [])
+                    children = get_children(item)
                     if children:
                         for child in children:
-                            child_result = process_item(child, current_path)
+                            child_result = process_item(child, child_flags, icao)
                             if child_result:
                                 processed_item['children'].append(child_result)
                     return processed_item
                 
                 # 如果当前节点不需要保留，但可能包含需要保留的子节点
-                children = item.get('children', [])
+                children = get_children(item)
                 if children:
                     filtered_children = []
                     for child in children:
-                        child_result = process_item(child, current_path)
+                        child_result = process_item(child, child_flags, icao)
                         if child_result:
                             filtered_children.append(child_result)
                     if filtered_children:
@@ -96,10 +105,16 @@ class AipFilter:
                 if result:
                     filtered.append(result)
             
+            print(f"过滤规则命中: {rules.summary()}")
+            if writer is not None:
+                writer.close()
+            
             # 保存PDF路径到文件
-            output_dir = os.path.dirname(os.path.abspath(__file__))
-            with open(os.path.join(output_dir, 'pdf_paths.txt'), 'w', encoding='utf-8') as f:
-                f.write('\n'.join(pdf_paths))
+            if save_paths:
+                output_dir = os.path.dirname(os.path.abspath(__file__))
+                with metrics.timer('write_pdf_paths'):
+                    with open(os.path.join(output_dir, 'pdf_paths.txt'), 'w', encoding='utf-8') as f:
+                        f.write('\n'.join(pdf_paths))
             
             return filtered
             
@@ -107,24 +122,75 @@ class AipFilter:
             print(f"过滤内容时发生错误: {str(e)}")
             return []
 
+    @staticmethod
+    def stream_filter(records, package_info=None, rules=None, index=None, output_path=None, manifest=None):
+        """流式过滤：逐条处理记录并增量写入pdf_paths.txt（以及可选的结构化清单）
+
+        要求父节点先于子节点出现（AIP.JSON即按此顺序排列），这样祖先标记
+        在子节点到达时已经确定。传入index时同时增量建立索引。
+        产出每个命中规则且带PDF的 (名称, URL, 记录)。
+        """
+        if rules is None:
+            rules = FilterRules()
+        rules.reset_hits()
+        if output_path is None:
+            output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_paths.txt')
+
+        node_flags = {}  # id -> 传递给子节点的标记
+        node_icao = {}   # id -> 所属机场ICAO
+        writer = manifest.writer(package_info) if manifest is not None else None
+        try:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                first = True
+                for item in records:
+                    if not is_record(item):
+                        continue
+                    if index is not None:
+                        index.add(item)
+
+                    name_cn = item.get('name_cn', '')
+                    inherited = node_flags.get(item.get('pId'), frozenset())
+                    matched_rule, flags = rules.evaluate(name_cn, inherited)
+                    if flags:
+                        node_flags[item.get('id')] = flags
+                    icao = AipIndex.node_icao(item) or node_icao.get(item.get('pId'))
+                    if icao:
+                        node_icao[item.get('id')] = icao
+                    if matched_rule is None:
+                        continue
+
+                    full_url = chart_url(package_info, item.get('pdfPath', ''))
+                    if full_url:
+                        f.write(("" if first else "\n") + f"{name_cn}: {full_url}")
+                        first = False
+                        if writer is not None:
+                            writer.add(item, icao, full_url)
+                        yield name_cn, full_url, item
+        except BaseException:
+            # 下载或解析中途失败（或调用方提前停止迭代）时记录不完整，不能按本次结果清理清单
+            if writer is not None:
+                writer.abort()
+            raise
+
+        if writer is not None:
+            writer.close()
+        print(f"过滤规则命中: {rules.summary()}")
+
     @staticmethod
     def print_structure(filtered_content, level=0):
-        """打印过滤后的目录结构"""
+        """打印过滤后的目录结构（先写入缓冲区，最后一次性输出）"""
         if not filtered_content:
             print("未找到相关目录内容")
             return
-            
-        indent = "  " * level
-        for item in filtered_content:
+
+        lines = []
+        stack = [(item, level) for item in reversed(filtered_content)]
+        while stack:
+            item, depth = stack.pop()
             # 获取中文名称和修改状态
             name_cn = item.get('name_cn', '未知标题')
-            is_modified = item.get('Is_Modified', 'N')
-            
-            # 打印当前项
-            prefix = "*" if is_modified == "Y" else "-"
-            print(f"{indent}{prefix} {name_cn}")
-            
-            # 递归打印子目录
-            children = item.get('children', [])
-            if children:
-                AipFilter.print_structure(children, level + 1)
+            prefix = "*" if item.get('Is_Modified', 'N') == "Y" else "-"
+            lines.append(f"{'  ' * depth}{prefix} {name_cn}")
+            # 子目录按原顺序入栈
+            stack.extend((child, depth + 1) for child in reversed(item.get('children') or []))
+        print('\n'.join(lines))
@@ -0,0 +1,140 @@
+import re
+from aip_node import is_record
+
+
+class AipIndex:
+    """AIP.JSON扁平列表（id/pId关联）的一次性索引"""
+
+    # 机场节点名称形如 "ZBAA-北京/首都"，航图节点形如 "ZBAA-1A:ADC"
+    AIRPORT_PATTERN = re.compile(r'^(Z[A-Z]{3})-\D')
+    # 航图编号形如 "ZYYJ-20B"
+    CHART_CODE_PATTERN = re.compile(r'^(Z[A-Z]{3}-\d+[A-Z0-9]*)')
+
+    def __init__(self, records):
+        if isinstance(records, dict):
+            records = [records]
+        self.nodes = {}        # id -> 节点
+        self.child_ids = {}    # pId -> [子节点id]
+        self.root_ids = None
+        self.icao_map = {}     # ICAO -> 机场节点id
+        self._path_cache = {}
+
+        for item in records or []:
+            self.add(item)
+
+    def add(self, item):
+        """增量加入一条记录（可用于流式解析）"""
+        if not is_record(item) or not item.get('id'):
+            return
+        node_id = item['id']
+        self.nodes[node_id] = item
+        self.child_ids.setdefault(item.get('pId') or '', []).append(node_id)
+        self.root_ids = None
+
+        icao = self.node_icao(item)
+        if icao and icao not in self.icao_map:
+            self.icao_map[icao] = node_id
+
+    @classmethod
+    def node_icao(cls, item):
+        """机场节点的ICAO代码（取airporticao或从名称解析），其他节点返回None"""
+        icao = item.get('airporticao')
+        if not icao:
+            match = cls.AIRPORT_PATTERN.match(str(item.get('name_cn', '')))
+            icao = match.group(1) if match else None
+        return icao
+
+    @classmethod
+    def chart_code(cls, item):
+        """航图节点的编号，非航图节点返回None"""
+        match = cls.CHART_CODE_PATTERN.match(str(item.get('name_cn') or item.get('name') or ''))
+        return match.group(1) if match else None
+
+    def _root_ids(self):
+        # 父节点不存在的记录视为顶层节点
+        if self.root_ids is None:
+            self.root_ids = []
+            for parent_id, ids in self.child_ids.items():
+                if not parent_id or parent_id not in self.nodes:
+                    self.root_ids.extend(ids)
+        return self.root_ids
+
+    @staticmethod
+    def is_flat(data):
+        """判断数据是否为id/pId关联的扁平列表"""
+        if not isinstance(data, list) or not data:
+            return False
+        first = data[0]
+        return is_record(first) and 'pId' in first and 'children' not in first
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes.values())
+
+    def get(self, node_id):
+        return self.nodes.get(node_id)
+
+    def roots(self):
+        return [self.nodes[i] for i in self._root_ids()]
+
+    def children(self, node_id):
+        return [self.nodes[i] for i in self.child_ids.get(node_id, ())]
+
+    def parent(self, node_id):
+        node = self.nodes.get(node_id)
+        return self.nodes.get(node.get('pId')) if node else None
+
+    def path_ids(self, node_id):
+        """返回从根到该节点的id元组（带缓存）"""
+        cached = self._path_cache.get(node_id)
+        if cached is not None:
+            return cached
+
+        # 向上找到第一个已缓存的祖先，再自顶向下补齐缓存
+        chain = []
+        seen = set()
+        current = node_id
+        prefix = ()
+        while current in self.nodes and current not in seen:
+            if current in self._path_cache:
+                prefix = self._path_cache[current]
+                break
+            seen.add(current)
+            chain.append(current)
+            current = self.nodes[current].get('pId')
+
+        for current in reversed(chain):
+            prefix = prefix + (current,)
+            self._path_cache[current] = prefix
+        return self._path_cache.get(node_id, ())
+
+    def path(self, node_id):
+        """返回从根到该节点的中文名称列表"""
+        return [self.nodes[i].get('name_cn', '') for i in self.path_ids(node_id)]
+
+    def airports(self):
+        return sorted(self.icao_map)
+
+    def airport(self, icao):
+        node_id = self.icao_map.get(str(icao).upper())
+        return self.nodes.get(node_id) if node_id else None
+
+    def iter_subtree(self, node_id):
+        """先序遍历子树（包含根节点）"""
+        stack = [node_id]
+        while stack:
+            current = stack.pop()
+            node = self.nodes.get(current)
+            if node is None:
+                continue
+            yield node
+            stack.extend(reversed(self.child_ids.get(current, ())))
+
+    def charts(self, icao):
+        """返回机场子树下所有带PDF的节点"""
+        node_id = self.icao_map.get(str(icao).upper())
+        if not node_id:
+            return []
+        return [node for node in self.iter_subtree(node_id) if node.get('pdfPath')]
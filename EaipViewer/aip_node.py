@@ -0,0 +1,82 @@
+import sys
+
+
+class AipNode:
+    """AIP.JSON节点的紧凑表示
+
+    使用__slots__代替字典；pdfPath拆分为目录前缀和文件名两部分，
+    前缀（如 /Data/EAIP2025-02.V1.5/Terminal/ZBAA/）经过intern后在同目录节点间共享。
+    提供与字典相同的get()/[]访问方式，可直接替代原始记录使用。
+    """
+
+    FIELDS = ('id', 'pId', 'name', 'airporticao', 'name_cn', 'pdfPath',
+              'htmlPath', 'htmlEnPath', 'isOpened', 'Is_Modified')
+
+    __slots__ = ('id', 'pId', 'name', 'airporticao', 'name_cn', 'pdf_dir', 'pdf_file',
+                 'htmlPath', 'htmlEnPath', 'isOpened', 'Is_Modified')
+
+    def __init__(self, id, pId='', name='', airporticao=None, name_cn='', pdfPath='',
+                 htmlPath=None, htmlEnPath=None, isOpened=False, Is_Modified='N'):
+        self.id = id
+        self.pId = pId or ''
+        self.name = name
+        self.airporticao = sys.intern(airporticao) if airporticao else airporticao
+        self.name_cn = name_cn
+        self.pdfPath = pdfPath
+        self.htmlPath = htmlPath
+        self.htmlEnPath = htmlEnPath
+        self.isOpened = bool(isOpened)
+        self.Is_Modified = sys.intern(Is_Modified or 'N')
+
+    @property
+    def pdfPath(self):
+        return self.pdf_dir + self.pdf_file
+
+    @pdfPath.setter
+    def pdfPath(self, value):
+        value = value or ''
+        head, sep, tail = value.rpartition('/')
+        self.pdf_dir = sys.intern(head + sep)
+        self.pdf_file = tail
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(**{key: item.get(key) for key in cls.FIELDS if key in item})
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __repr__(self):
+        return f"AipNode({self.id!r}, {self.name_cn!r})"
+
+
+def is_record(item):
+    """判断是否为AIP记录（原始字典或AipNode）"""
+    return isinstance(item, (dict, AipNode))
+
+
+def compact_records(records):
+    """将原始字典记录转换为AipNode列表，父节点id字符串在子节点间共享"""
+    nodes = []
+    ids = {}
+    for item in records or []:
+        if not is_record(item):
+            continue
+        node = item if isinstance(item, AipNode) else AipNode.from_dict(item)
+        node.id = ids.setdefault(node.id, node.id)
+        node.pId = ids.setdefault(node.pId, node.pId)
+        nodes.append(node)
+    return nodes
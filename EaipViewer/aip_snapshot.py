@@ -0,0 +1,149 @@
+import hashlib
+from array import array
+import marshal
+import os
+import time
+from aip_node import AipNode, compact_records
+
+
+class AipSnapshot:
+    """已解析AIP目录的二进制快照
+
+    以package的filePath/dataName为键，将节点按列存储（字符串表 + 整型索引数组），
+    使用marshal序列化。package未变化时直接加载快照，无需重新下载和解析AIP.JSON。
+    """
+
+    MAGIC = b'EAIPSNAP'
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @classmethod
+    def from_config(cls, login):
+        return cls(login.resolve_path(login.config.get('snapshot', 'cache_dir', fallback='snapshots')))
+
+    @staticmethod
+    def package_key(package_info):
+        """package的快照键"""
+        file_path = str(package_info.get('filePath', '')).replace('\\', '/')
+        data_name = str(package_info.get('dataName', ''))
+        return hashlib.sha1(f"{file_path}|{data_name}".encode('utf-8')).hexdigest()
+
+    def path(self, package_info):
+        return os.path.join(self.cache_dir, self.package_key(package_info) + '.snap')
+
+    @staticmethod
+    def _encode(nodes):
+        """将节点列表编码为按列存储的结构"""
+        strings = []
+        string_ids = {}
+
+        def ref(value):
+            # None使用-1表示
+            if value is None:
+                return -1
+            idx = string_ids.get(value)
+            if idx is None:
+                idx = string_ids[value] = len(strings)
+                strings.append(value)
+            return idx
+
+        columns = {key: array('i') for key in (
+            'id', 'pId', 'name', 'airporticao', 'name_cn',
+            'pdf_dir', 'pdf_file', 'htmlPath', 'htmlEnPath')}
+        flags = bytearray()
+        for node in nodes:
+            for key, column in columns.items():
+                column.append(ref(getattr(node, key)))
+            flags.append((1 if node.isOpened else 0) | (2 if node.Is_Modified == 'Y' else 0))
+        return {
+            'strings': strings,
+            'columns': {key: column.tobytes() for key, column in columns.items()},
+            'flags': bytes(flags),
+        }
+
+    @staticmethod
+    def _decode(payload):
+        strings = payload['strings']
+        columns = payload['columns']
+        flags = payload['flags']
+
+        def col(key):
+            refs = array('i')
+            refs.frombytes(columns[key])
+            return [strings[i] if i >= 0 else None for i in refs]
+
+        ids, pids, names = col('id'), col('pId'), col('name')
+        icaos, names_cn = col('airporticao'), col('name_cn')
+        pdf_dirs, pdf_files = col('pdf_dir'), col('pdf_file')
+        html, html_en = col('htmlPath'), col('htmlEnPath')
+
+        nodes = []
+        for i in range(len(ids)):
+            node = AipNode.__new__(AipNode)
+            node.id = ids[i]
+            node.pId = pids[i]
+            node.name = names[i]
+            node.airporticao = icaos[i]
+            node.name_cn = names_cn[i]
+            node.pdf_dir = pdf_dirs[i]
+            node.pdf_file = pdf_files[i]
+            node.htmlPath = html[i]
+            node.htmlEnPath = html_en[i]
+            node.isOpened = bool(flags[i] & 1)
+            node.Is_Modified = 'Y' if flags[i] & 2 else 'N'
+            nodes.append(node)
+        return nodes
+
+    def save(self, package_info, records):
+        """保存快照，返回快照文件路径，失败时返回None"""
+        if not package_info or not records:
+            return None
+        nodes = compact_records(records)
+        data = {
+            'format': self.FORMAT_VERSION,
+            'package': {
+                'filePath': package_info.get('filePath'),
+                'dataName': package_info.get('dataName'),
+            },
+            'created_at': time.time(),
+            'payload': self._encode(nodes),
+        }
+        path = self.path(package_info)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(self.MAGIC)
+                f.write(marshal.dumps(data))
+            os.replace(tmp_path, path)
+            return path
+        except OSError as e:
+            print(f"保存AIP快照失败: {str(e)}")
+            return None
+
+    def load(self, package_info):
+        """加载快照，返回AipNode列表；快照不存在或无效时返回None"""
+        if not package_info:
+            return None
+        path = self.path(package_info)
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    return None
+                # 一次性读入后再反序列化，比marshal.load逐段读取文件快得多
+                data = marshal.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            print(f"读取AIP快照失败: {str(e)}")
+            return None
+
+        if data.get('format') != self.FORMAT_VERSION:
+            return None
+        package = data.get('package', {})
+        if (package.get('filePath') != package_info.get('filePath')
+                or package.get('dataName') != package_info.get('dataName')):
+            return None
+        return self._decode(data['payload'])
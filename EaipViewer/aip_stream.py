@@ -0,0 +1,83 @@
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+# 缓冲区累积到该长度后才尝试解析，避免小数据块导致对同一条不完整记录反复解析
+MIN_PARSE_SIZE = 4096
+
+
+def _skip_whitespace(buf, pos):
+    length = len(buf)
+    while pos < length and buf[pos] in WHITESPACE:
+        pos += 1
+    return pos
+
+
+def iter_json_array(chunks):
+    """从字节块流中逐条解析顶层JSON数组的元素
+
+    只在内存中保留尚未解析完的一小段缓冲区，每解析出一条记录就立即产出，
+    不必等待整个响应体下载完成。顶层不是数组时退回整体解析。
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    pending = []
+    pending_size = 0
+    started = False
+    finished = False
+
+    chunks = iter(chunks)
+    while not finished:
+        chunk = next(chunks, None)
+        final = chunk is None
+        text = utf8.decode(b'' if final else chunk, final=final)
+        if text:
+            pending.append(text)
+            pending_size += len(text)
+        if not final and pending_size < MIN_PARSE_SIZE:
+            continue
+
+        buf = buf[pos:] + ''.join(pending)
+        pos = 0
+        pending = []
+        pending_size = 0
+        finished = final
+
+        while True:
+            pos = _skip_whitespace(buf, pos)
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    # 顶层为对象等非数组数据，读取剩余内容后整体解析
+                    rest = [buf[pos:]]
+                    for chunk in chunks:
+                        rest.append(utf8.decode(chunk))
+                    rest.append(utf8.decode(b'', final=True))
+                    yield json.loads(''.join(rest))
+                    return
+                started = True
+                pos += 1
+                continue
+
+            ch = buf[pos]
+            if ch == ',':
+                pos += 1
+                continue
+            if ch == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise ValueError("JSON数组不完整")
+                break  # 记录不完整，等待更多数据
+            if end >= len(buf) and not final and not isinstance(obj, (dict, list)):
+                break  # 数字等标量可能被截断，等待更多数据
+            yield obj
+            pos = end
+
+    if started:
+        raise ValueError("JSON数组不完整")
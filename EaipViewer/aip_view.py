@@ -0,0 +1,150 @@
+import json
+import re
+from aip_index import AipIndex
+from aip_node import compact_records
+
+
+class AipView:
+    """按需展开的AIP目录视图
+
+    只遍历被查询到的子树：按ICAO（ZBAA）、章节（ENR 6、AD 2、ENR 6.3）或只看修改项选取根节点，
+    再按深度限制逐层展开，输出先写入缓冲区，最后一次性返回文本、树形图或JSON。
+    开销与显示的节点数成正比，而不是与整个package的大小成正比。
+    """
+
+    # 章节节点位于目录前几层（部分 -> 章 -> 节），按章节查找时不再往下搜索
+    CHAPTER_DEPTH = 3
+
+    def __init__(self, data):
+        if isinstance(data, AipIndex):
+            self.index = data
+        else:
+            self.index = AipIndex(compact_records([data] if isinstance(data, dict) else data or []))
+        self._modified = {}  # 节点id -> 子树内是否有修改
+
+    def find_chapter(self, chapter):
+        """按章节编号查找节点，例如 "ENR 6"、"AD 2"、"ENR 6.3"，不区分大小写"""
+        pattern = re.compile(r'^' + re.escape(chapter.strip()) + r'(\s|$)', re.I)
+        level = [node['id'] for node in self.index.roots()]
+        for _ in range(self.CHAPTER_DEPTH):
+            next_level = []
+            for node_id in level:
+                if pattern.match(self.index.get(node_id).get('name_cn') or ''):
+                    return node_id
+                next_level.extend(self.index.child_ids.get(node_id, ()))
+            level = next_level
+        return None
+
+    def select(self, query=None):
+        """将查询解析为根节点id列表：ICAO、章节编号，或为空时取整个目录的顶层节点
+
+        多个查询用逗号分隔，例如 "ZBAA,ZSPD" 或 "ENR 6,AD 2"。
+        """
+        if not query:
+            return [node['id'] for node in self.index.roots()]
+        roots = []
+        for part in (p.strip() for p in query.split(',')):
+            if not part:
+                continue
+            node_id = self.index.icao_map.get(part.upper()) or self.find_chapter(part)
+            if node_id:
+                roots.append(node_id)
+            else:
+                print(f"未找到: {part}")
+        return roots
+
+    def has_modified(self, node_id):
+        """子树内是否有Is_Modified为Y的节点（按需计算并缓存）"""
+        cached = self._modified.get(node_id)
+        if cached is not None:
+            return cached
+        # 迭代后序遍历，避免深层递归
+        stack = [(node_id, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if current in self._modified:
+                continue
+            children = self.index.child_ids.get(current, ())
+            if not expanded:
+                stack.append((current, True))
+                stack.extend((child, False) for child in children if child not in self._modified)
+                continue
+            node = self.index.get(current)
+            self._modified[current] = (node is not None and node.get('Is_Modified') == 'Y') or \
+                any(self._modified.get(child) for child in children)
+        return self._modified[node_id]
+
+    def _visible(self, node_ids, modified_only):
+        if not modified_only:
+            return list(node_ids)
+        return [node_id for node_id in node_ids if self.has_modified(node_id)]
+
+    def walk(self, roots, depth=None, modified_only=False):
+        """先序遍历选中的子树，产出 (层级, 节点, 被深度限制隐藏的子节点数, 是否为同级最后一个)"""
+        visible = self._visible(roots, modified_only)
+        stack = [(node_id, 0, i == len(visible) - 1) for i, node_id in reversed(list(enumerate(visible)))]
+        while stack:
+            node_id, level, is_last = stack.pop()
+            node = self.index.get(node_id)
+            if node is None:
+                continue
+            children = self._visible(self.index.child_ids.get(node_id, ()), modified_only)
+            if depth is not None and level >= depth:
+                yield level, node, len(children), is_last
+                continue
+            yield level, node, 0, is_last
+            last = len(children) - 1
+            stack.extend((child, level + 1, i == last) for i, child in reversed(list(enumerate(children))))
+
+    def render_text(self, query=None, depth=None, modified_only=False):
+        """与print_structure相同的缩进格式（* 表示已修改）"""
+        lines = []
+        for level, node, hidden, _ in self.walk(self.select(query), depth, modified_only):
+            prefix = "*" if node.get('Is_Modified') == "Y" else "-"
+            suffix = f" （另有{hidden}项）" if hidden else ""
+            lines.append(f"{'  ' * level}{prefix} {node.get('name_cn', '未知标题')}{suffix}")
+        return '\n'.join(lines)
+
+    def render_tree(self, query=None, depth=None, modified_only=False):
+        """树形图格式（* 表示已修改）"""
+        lines = []
+        open_levels = []  # 各层祖先之后是否还有兄弟节点，决定是否画竖线
+        for level, node, hidden, is_last in self.walk(self.select(query), depth, modified_only):
+            del open_levels[level:]
+            mark = "*" if node.get('Is_Modified') == "Y" else ""
+            suffix = f" （另有{hidden}项）" if hidden else ""
+            label = f"{mark}{node.get('name_cn', '未知标题')}{suffix}"
+            if level == 0:
+                lines.append(label)
+            else:
+                indent = ''.join('│   ' if more else '    ' for more in open_levels[1:level])
+                lines.append(f"{indent}{'└── ' if is_last else '├── '}{label}")
+            open_levels.append(not is_last)
+        return '\n'.join(lines)
+
+    def to_dict(self, query=None, depth=None, modified_only=False):
+        """嵌套字典结构（与filter_content的输出格式一致），被深度限制截断的节点给出hidden数量"""
+        result = []
+        parents = []  # 各层级当前的children列表
+        for level, node, hidden, _ in self.walk(self.select(query), depth, modified_only):
+            item = {
+                'name_cn': node.get('name_cn', ''),
+                'Is_Modified': node.get('Is_Modified', 'N'),
+                'children': [],
+            }
+            if node.get('pdfPath'):
+                item['pdfPath'] = node.get('pdfPath')
+            if hidden:
+                item['hidden'] = hidden
+            del parents[level:]
+            (parents[-1] if parents else result).append(item)
+            parents.append(item['children'])
+        return result
+
+    def render(self, query=None, depth=None, modified_only=False, fmt='text'):
+        """按格式返回渲染结果：text / tree / json"""
+        if fmt == 'json':
+            return json.dumps(self.to_dict(query, depth, modified_only), ensure_ascii=False, indent=2)
+        if fmt == 'tree':
+            return self.render_tree(query, depth, modified_only)
+        return self.render_text(query, depth, modified_only)
@@ -0,0 +1,106 @@
+import os
+import shutil
+from chart_downloader import chart_url
+
+
+class AiracSync:
+    """增量同步：只下载新增或修改的航图，未变化的文件按哈希文件名复用"""
+
+    def __init__(self, downloader):
+        self.downloader = downloader
+        self.output_dir = downloader.output_dir
+
+    @staticmethod
+    def charts_from_aip(aip_json, package_info, urls=None):
+        """从AIP.JSON收集航图，返回去重后的 (名称, URL, 是否修改) 列表
+
+        urls不为空时只保留其中的URL（例如pdf_paths.txt中过滤后的航图）。
+        """
+        if isinstance(aip_json, dict):
+            aip_json = [aip_json]
+        charts = {}
+        for item in aip_json or []:
+            url = chart_url(package_info, item.get('pdfPath', ''))
+            if not url or (urls is not None and url not in urls):
+                continue
+            modified = item.get('Is_Modified', 'N') == 'Y'
+            if url in charts:
+                name, _, was_modified = charts[url]
+                charts[url] = (name, url, was_modified or modified)
+            else:
+                charts[url] = (item.get('name_cn', ''), url, modified)
+        return list(charts.values())
+
+    def build_hash_index(self):
+        """扫描本地镜像，建立 哈希文件名 -> 本地路径 的索引"""
+        index = {}
+        if not os.path.isdir(self.output_dir):
+            return index
+        for root, _, files in os.walk(self.output_dir):
+            for filename in files:
+                if not filename.lower().endswith('.pdf'):
+                    continue
+                path = os.path.join(root, filename)
+                if os.path.getsize(path) > 0:
+                    index.setdefault(filename.lower(), path)
+        return index
+
+    @staticmethod
+    def reuse_file(src, dest):
+        """优先使用硬链接复用文件，跨设备等情况下退回复制"""
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.link(src, dest)
+            return 'link'
+        except OSError:
+            shutil.copy2(src, dest)
+            return 'copy'
+
+    def plan(self, charts):
+        """对比本地镜像，将航图分为 已存在 / 可复用 / 需下载 三类"""
+        hash_index = self.build_hash_index()
+        present, reuse, download = [], [], []
+        for name, url, modified in charts:
+            dest = self.downloader.local_path(url)
+            if os.path.exists(dest) and os.path.getsize(dest) > 0:
+                present.append((name, url))
+                continue
+            src = hash_index.get(os.path.basename(dest).lower())
+            if src:
+                reuse.append((name, url, src, dest))
+            else:
+                download.append((name, url, modified))
+        return present, reuse, download
+
+    def sync(self, charts, download_func=None):
+        """执行增量同步，返回统计信息
+
+        download_func为接收 (名称, URL) 列表并返回统计信息的函数（例如优先级预取），默认并发下载。
+        """
+        present, reuse, download = self.plan(charts)
+        modified_count = sum(1 for _, _, modified in download if modified)
+        print(f"同步计划: 已存在 {len(present)}，复用 {len(reuse)}，"
+              f"需下载 {len(download)}（其中标记修改 {modified_count}）")
+
+        linked = copied = 0
+        for name, url, src, dest in reuse:
+            try:
+                if self.reuse_file(src, dest) == 'link':
+                    linked += 1
+                else:
+                    copied += 1
+            except OSError as e:
+                print(f"复用文件失败 {name}: {str(e)}")
+                download.append((name, url, False))
+        if reuse:
+            print(f"已复用未变化航图: 硬链接 {linked}，复制 {copied}")
+        for name, url in present:
+            self.downloader.record(url, 'skipped')
+        for name, url, src, dest in reuse:
+            if os.path.exists(dest):
+                self.downloader.record(url, 'skipped')
+
+        tasks = [(name, url) for name, url, _ in download]
+        stats = (download_func or self.downloader.download_all)(tasks)
+        stats.update({'present': len(present), 'linked': linked, 'copied': copied})
+        return stats
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+import aiohttp
+from yarl import URL
+from chart_downloader import ChartDownloader, DownloadStats, local_path, url_to_relpath, verify_file
+from http_policy import RETRY_STATUSES, parse_retry_after
+from instrumentation import metrics
+
+
+class AsyncTokenBucket:
+    """协程版令牌桶，等待时不阻塞事件循环"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncEaipClient:
+    """基于aiohttp的异步eAIP客户端
+
+    与EaipLogin共享配置、会话缓存文件、token和Cookie：可以从已登录的EaipLogin继续使用，
+    异步登录成功后也会写回EaipLogin和会话缓存。重试沿用HttpPolicy的退避参数和限速配置，
+    单线程内即可维持上千个并发请求。
+
+        async with AsyncEaipClient(login, concurrency=64) as client:
+            package_info = await client.get_current_package()
+            async for name, url, status, size in client.iter_downloads(tasks):
+                ...
+    """
+
+    def __init__(self, login, concurrency=None, output_dir=None, manifest=None):
+        self.login = login
+        self.base_url = login.base_url
+        self.concurrency = concurrency or login.config.getint('download', 'workers', fallback=8)
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=login.timeout, sock_read=login.timeout)
+        self.policy = login.policy
+        self.bucket = AsyncTokenBucket(login.policy.bucket.rate, login.policy.bucket.capacity)
+        self.downloader = ChartDownloader(login, output_dir=output_dir, manifest=manifest)
+        self.captcha_id = None
+        self.http = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        if self.http is not None:
+            return
+        headers = dict(self.login.session.headers)
+        # aiohttp默认不支持br/zstd解码
+        headers['Accept-Encoding'] = 'gzip, deflate'
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=False)
+        self.http = aiohttp.ClientSession(headers=headers, connector=connector, timeout=self.timeout)
+        self.sync_from_login()
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.close()
+            self.http = None
+
+    def sync_from_login(self):
+        """从同步客户端复制token和Cookie"""
+        token = self.login.session.headers.get('token')
+        if token:
+            self.http.headers['token'] = token
+        cookies = {cookie.name: cookie.value for cookie in self.login.session.cookies}
+        if cookies:
+            self.http.cookie_jar.update_cookies(cookies, response_url=URL(self.base_url))
+
+    def set_login_cookie(self, token, user_uuid):
+        """设置token和Cookie，并同步到EaipLogin"""
+        self.login.set_login_cookie("userid", user_uuid)
+        self.login.set_login_cookie("username", token)
+        self.http.headers['token'] = token
+        self.http.cookie_jar.update_cookies({'username': token, 'userId': user_uuid},
+                                            response_url=URL(self.base_url))
+
+    @property
+    def proxy(self):
+        return self.login.session.proxies.get('http') if self.login.session.proxies else None
+
+    async def _request(self, method, url, read='json', **kwargs):
+        """发送请求并读取响应体，连接错误、超时和可重试状态码按共享策略重试
+
+        read为 'json' / 'bytes' / None（None时返回未读取的响应，由调用方负责释放）。
+        返回 (状态码, 内容)。
+        """
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = await self.http.request(method, url, proxy=self.proxy, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                metrics.record_request(url, None, time.perf_counter() - start, retry=attempt > 0)
+                attempt += 1
+                if attempt > self.policy.max_retries:
+                    print(f"请求失败，已重试{self.policy.max_retries}次: {str(e)}")
+                    raise
+                await asyncio.sleep(self.policy.backoff(attempt - 1))
+                continue
+
+            if response.status in RETRY_STATUSES and attempt < self.policy.max_retries:
+                metrics.record_request(url, response.status, time.perf_counter() - start, retry=attempt > 0)
+                delay = self.policy.backoff(attempt, parse_retry_after(response.headers.get('Retry-After')))
+                response.release()
+                attempt += 1
+                print(f"服务器返回{response.status}，{delay:.1f}秒后进行第{attempt}次重试...")
+                await asyncio.sleep(delay)
+                continue
+
+            if read is None:
+                metrics.record_request(url, response.status, time.perf_counter() - start,
+                                       response.content_length or 0, retry=attempt > 0)
+                return response.status, response
+            try:
+                body = await response.read()
+            finally:
+                response.release()
+            metrics.record_request(url, response.status, time.perf_counter() - start, len(body), retry=attempt > 0)
+            if read == 'json':
+                return response.status, await self._decode_json(body)
+            return response.status, body
+
+    @staticmethod
+    async def _decode_json(body):
+        """解析JSON，较大的响应（如AIP.JSON）放到线程中解析以免阻塞事件循环"""
+        try:
+            if len(body) > 1024 * 1024:
+                with metrics.timer('json_decode'):
+                    return await asyncio.to_thread(json.loads, body)
+            return json.loads(body)
+        except ValueError:
+            return None
+
+    def _login_expired(self, data):
+        if isinstance(data, dict) and data.get('retCode') == 0 and 'login has expired' in str(data.get('retMsg', '')):
+            print("会话已过期，需要重新登录")
+            self.login.clear_session()
+            return True
+        return False
+
+    async def get_captcha(self):
+        """获取验证码图片内容"""
+        self.captcha_id = str(uuid.uuid4())
+        status, body = await self._request('GET', f"{self.base_url}/login/captcha?captchaId={self.captcha_id}",
+                                           read='bytes')
+        return body if status == 200 else None
+
+    async def login_with_captcha(self, username, password, captcha_text):
+        """使用验证码登录，成功后保存会话缓存"""
+        if not self.captcha_id:
+            return False
+        login_data = {
+            "username": username,
+            "password": self.login.encrypt_password(password),
+            "captcha": captcha_text,
+            "captchaId": self.captcha_id
+        }
+        status, data = await self._request('POST', f"{self.base_url}/login/login", json=login_data)
+        if status != 200 or not data:
+            print(f"登录请求失败，状态码: {status}")
+            return False
+        if data.get("retCode") != 200:
+            print(f"登录失败：{data.get('retMsg', '未知错误')}")
+            return False
+        token = data["data"]["token"]
+        user_uuid = data["data"]["eaipUserUuid"]
+        self.set_login_cookie(token, user_uuid)
+        self.login.save_session(token, user_uuid)
+        return True
+
+    async def login_interactive(self):
+        """交互式登录：验证码保存为captcha.jpg，在线程中等待输入，不阻塞事件循环"""
+        captcha = await self.get_captcha()
+        if not captcha:
+            print("获取验证码失败")
+            return False
+        with open("captcha.jpg", "wb") as f:
+            f.write(captcha)
+        captcha_text = await asyncio.to_thread(input, "请输入验证码（captcha.jpg）: ")
+        return await self.login_with_captcha(
+            self.login.config.get('account', 'username'),
+            self.login.config.get('account', 'password'),
+            captcha_text
+        )
+
+    async def restore_session(self):
+        """从会话缓存恢复并验证登录状态"""
+        data = self.login.load_session()
+        if not data:
+            return False
+        self.set_login_cookie(data['token'], data['userId'])
+        result = await self.validate_admin()
+        return result is not None and not self._login_expired(result)
+
+    async def ensure_login(self):
+        if await self.restore_session():
+            return True
+        return await self.login_interactive()
+
+    async def validate_admin(self):
+        status, data = await self._request('POST', f"{self.base_url}/user/validSuperAdmin", data=b'')
+        return data if status == 200 else None
+
+    async def get_publication_list(self):
+        status, data = await self._request('POST', f"{self.base_url}/publication/listByLoginPage", json={})
+        return data if status == 200 else None
+
+    async def get_package_list(self):
+        """获取包列表；会话有效时首个请求即返回数据，否则预热后再请求一次"""
+        url = f"{self.base_url}/package/listPage"
+        for attempt in range(2):
+            status, data = await self._request('POST', url, json={})
+            if status != 200 or self._login_expired(data):
+                return None
+            if self.login._has_package_data(data):
+                return data
+            if attempt == 0:
+                await asyncio.sleep(1)
+        return data
+
+    async def get_current_package(self):
+        data = await self.get_package_list()
+        if not data or not isinstance(data.get("data"), dict):
+            print("获取包列表失败")
+            return None
+        for pkg in data["data"].get("data") or []:
+            if pkg.get("dataStatus") == "CURRENTLY_ISSUE":
+                return pkg
+        print("未找到当前生效版本")
+        return None
+
+    async def get_aip_json(self, package_info):
+        url = f"{self.base_url}/{package_info['filePath']}/JsonPath/AIP.JSON"
+        status, data = await self._request('GET', url)
+        if status != 200:
+            print(f"获取AIP.JSON失败, 状态码: {status}")
+            return None
+        return data or None
+
+    async def download(self, url, dest=None):
+        """下载单个航图到本地镜像目录，返回 (状态, 字节数)"""
+        dest = dest or local_path(self.downloader.output_dir, url)
+        if os.path.exists(dest) and os.path.getsize(dest) > 0:
+            return 'skipped', 0
+        part = dest + '.part'
+        received = 0
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            status, response = await self._request('GET', f"{self.base_url}/{url_to_relpath(url)}", read=None,
+                                                    headers={'Accept-Encoding': 'identity'})
+            try:
+                if status != 200:
+                    raise aiohttp.ClientResponseError(response.request_info, (), status=status)
+                with open(part, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(self.downloader.chunk_size):
+                        f.write(chunk)
+                        received += len(chunk)
+            finally:
+                response.release()
+            error = verify_file(part, response.content_length)
+            if error:
+                raise ValueError(f"文件校验失败: {error}")
+            os.replace(part, dest)
+            return 'ok', received
+        except Exception as e:
+            print(f"下载失败 {url}: {str(e) or type(e).__name__}")
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            return 'failed', 0
+
+    async def iter_downloads(self, tasks, concurrency=None):
+        """并发下载 (名称, URL) 列表，按完成顺序异步产出 (名称, URL, 状态, 字节数)
+
+        只创建concurrency个工作协程共享同一个任务迭代器，任务数很多时内存占用也保持不变。
+        """
+        pending = iter(tasks)
+        results = asyncio.Queue()
+        finished = object()
+
+        async def worker():
+            for name, url in pending:
+                status, size = await self.download(url)
+                await results.put((name, url, status, size))
+
+        async def run():
+            try:
+                await asyncio.gather(*(worker() for _ in range(concurrency or self.concurrency)))
+            finally:
+                results.put_nowait(finished)
+
+        runner = asyncio.create_task(run())
+        try:
+            while True:
+                item = await results.get()
+                if item is finished:
+                    break
+                yield item
+            await runner
+        finally:
+            runner.cancel()
+
+    async def download_all(self, tasks, concurrency=None):
+        """下载全部航图并返回统计信息，与ChartDownloader.download_all一致"""
+        stats = DownloadStats()
+        async for _, url, status, size in self.iter_downloads(tasks, concurrency):
+            stats.add(status, size)
+            self.downloader.record(url, status)
+        if self.downloader.manifest is not None:
+            self.downloader.manifest.commit()
+        print(f"下载结束: {stats.report()}")
+        return stats.summary()
+
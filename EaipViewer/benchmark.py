@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from aip_filter import AipFilter
+from aip_index import AipIndex
+from aip_node import compact_records
+from aip_snapshot import AipSnapshot
+from airac_sync import AiracSync
+from chart_downloader import ChartDownloader
+from eaip_login import EaipLogin
+from http_cache import HttpCache
+from http_policy import TokenBucket
+from instrumentation import metrics
+from mock_server import MockEaipServer
+from package_catalog import PackageCatalog
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块
+    resource = None
+
+
+class StageTimer:
+    """记录各阶段耗时"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.stages[name] = time.perf_counter() - start
+        return result
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # Linux下ru_maxrss单位为KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_benchmark(server, workers=8, charts=200, trace_memory=False, rate=None):
+    """在模拟服务器上跑一遍 登录 -> 包列表 -> AIP.JSON -> 过滤 -> 下载，返回结果字典"""
+    work_dir = tempfile.mkdtemp(prefix='eaip_bench_')
+    timer = StageTimer()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        login = EaipLogin(base_url=server.base_url)
+        login.session_file = os.path.join(work_dir, 'session.json')
+        # 每次测试使用空的条件请求缓存，结果不受之前运行的影响
+        login.http_cache = HttpCache(os.path.join(work_dir, 'http_cache'))
+        login.mount_adapter()
+        if rate is not None:
+            login.policy.bucket = TokenBucket(rate, max(1, int(rate) * 2))
+
+        timer.run('captcha', login.get_captcha)
+        ok = timer.run('login', login.login_with_captcha,
+                       login.config.get('account', 'username', fallback='bench'),
+                       login.config.get('account', 'password', fallback='bench'), '0000')
+        if not ok:
+            raise RuntimeError("模拟登录失败")
+
+        catalog = PackageCatalog(login, snapshot=AipSnapshot(os.path.join(work_dir, 'snapshots')))
+        package_info = timer.run('package_list', catalog.current_package)
+
+        url = f"{login.base_url}/{package_info['filePath']}/JsonPath/AIP.JSON"
+        raw = timer.run('aip_json_transfer', lambda: login._request('GET', url).content)
+        records = timer.run('json_decode', json.loads, raw)
+        index = timer.run('tree_build', lambda: AipIndex(compact_records(records)))
+        timer.run('filter', AipFilter.filter_content, index, package_info, save_paths=False)
+
+        tasks = [(name, chart_url) for name, chart_url, _ in AiracSync.charts_from_aip(index, package_info)]
+        downloader = ChartDownloader(login, output_dir=os.path.join(work_dir, 'charts'), workers=workers,
+                                     mount=True)
+        download = timer.run('download', downloader.download_all, tasks[:charts])
+
+        result = {
+            'stages': timer.stages,
+            'nodes': len(index),
+            'aip_json_bytes': len(raw),
+            'filter_nodes_per_sec': len(index) / max(timer.stages['filter'], 1e-9),
+            'download': download,
+            'server': dict(server.stats),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        if trace_memory:
+            result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        return result
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_report(result):
+    print("\n基准测试结果")
+    print("-" * 40)
+    for name, elapsed in result['stages'].items():
+        print(f"{name:<20}{elapsed * 1000:>12.1f} ms")
+    print("-" * 40)
+    print(f"节点数: {result['nodes']}，AIP.JSON: {result['aip_json_bytes'] / 1024:.0f} KB")
+    print(f"过滤吞吐量: {result['filter_nodes_per_sec']:.0f} 节点/秒")
+    download = result['download']
+    print(f"下载吞吐量: {download['files_per_sec']:.1f} 文件/秒，{download['mb_per_sec']:.2f} MB/秒"
+          f"（失败 {download['failed']}）")
+    if result.get('peak_rss_mb') is not None:
+        print(f"峰值内存(RSS): {result['peak_rss_mb']:.1f} MB")
+    if result.get('peak_traced_mb') is not None:
+        print(f"峰值Python内存分配: {result['peak_traced_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于本地模拟服务器的离线基准测试")
+    parser.add_argument('--latency', type=float, default=0.02, help="模拟每个请求的延迟（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟随机503的比例")
+    parser.add_argument('--scale', type=int, default=1, help="AIP目录放大倍数")
+    parser.add_argument('--pdf-size', type=int, default=200 * 1024, help="每个PDF的字节数")
+    parser.add_argument('--charts', type=int, default=200, help="下载阶段的航图数量")
+    parser.add_argument('--workers', type=int, default=8, help="下载线程数")
+    parser.add_argument('--rate', type=float, default=None, help="覆盖config.ini中的限速（每秒请求数，0为不限速）")
+    parser.add_argument('--trace-memory', action='store_true', help="使用tracemalloc统计峰值内存（会变慢）")
+    parser.add_argument('--json', default=None, metavar='PATH', help="将结果写入JSON文件")
+    parser.add_argument('--metrics', default=None, metavar='PATH', help="导出请求与阶段指标（.prom为Prometheus文本格式）")
+    parser.add_argument('--profile', default=None, metavar='DIR', help="对各阶段进行cProfile采样并保存到该目录")
+    args = parser.parse_args()
+    metrics.profile_dir = args.profile
+
+    server = MockEaipServer(latency=args.latency, error_rate=args.error_rate,
+                            scale=args.scale, pdf_size=args.pdf_size).start()
+    try:
+        result = run_benchmark(server, args.workers, args.charts, args.trace_memory, args.rate)
+    finally:
+        server.stop()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.metrics:
+        metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.exceptions import ChunkedEncodingError, RequestException
+from http_policy import RETRY_EXCEPTIONS
+from instrumentation import metrics
+
+BASE_URL = "https://www.eaipchina.cn/eaip/"
+
+
+def normalize_url(url):
+    """将filePath中的Windows反斜杠统一为正斜杠"""
+    return url.replace('\\', '/') if url else url
+
+
+def relative_pdf_path(pdf_path):
+    """节点pdfPath去掉版本前缀：/Data/<版本>/Terminal/ZBAA/xxx.pdf -> Terminal/ZBAA/xxx.pdf，已是相对路径时原样返回"""
+    if pdf_path and pdf_path.startswith('/'):
+        return pdf_path.split('/', 3)[-1]
+    return pdf_path
+
+
+def chart_url(package_info, pdf_path):
+    """根据package信息和节点pdfPath（或其相对路径）构建航图URL，pdfPath为空时返回None"""
+    if not pdf_path or not package_info or not package_info.get('filePath'):
+        return None
+    return normalize_url(f"{BASE_URL}{package_info['filePath']}/{relative_pdf_path(pdf_path)}")
+
+
+def url_to_relpath(url):
+    """从URL中提取本地镜像的相对路径"""
+    url = normalize_url(url)
+    if url.startswith(BASE_URL):
+        url = url[len(BASE_URL):]
+    elif '/eaip/' in url:
+        url = url.split('/eaip/', 1)[1]
+    return url.lstrip('/')
+
+
+def local_path(output_dir, url):
+    """URL在镜像目录output_dir下对应的本地文件路径"""
+    return os.path.join(output_dir, *url_to_relpath(url).split('/'))
+
+
+def verify_pdf(path, expected_size=None):
+    """校验下载结果：长度与服务器声明一致，且具有PDF文件头和结束标记"""
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        return f"文件长度不符: {size}/{expected_size}"
+    with open(path, 'rb') as f:
+        if not f.read(5).startswith(b'%PDF-'):
+            return "缺少PDF文件头"
+        f.seek(max(0, size - 1024))
+        if b'%%EOF' not in f.read():
+            return "缺少PDF结束标记"
+    return None
+
+
+def verify_file(path, expected_size=None):
+    """PDF按verify_pdf校验，其他文件（如AIP.JSON）只校验长度"""
+    if path.lower().endswith(('.pdf', '.pdf.part')):
+        return verify_pdf(path, expected_size)
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        return f"文件长度不符: {size}/{expected_size}"
+    return None
+
+
+class DownloadStats:
+    """下载吞吐量统计（线程安全）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def add(self, status, size=0):
+        with self.lock:
+            if status == 'ok':
+                self.completed += 1
+                self.bytes += size
+            elif status == 'skipped':
+                self.skipped += 1
+            else:
+                self.failed += 1
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+    def summary(self):
+        """返回统计信息字典"""
+        with self.lock:
+            elapsed = max(self.elapsed, 1e-6)
+            return {
+                'completed': self.completed,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'bytes': self.bytes,
+                'elapsed': elapsed,
+                'files_per_sec': self.completed / elapsed,
+                'mb_per_sec': self.bytes / elapsed / (1024 * 1024),
+            }
+
+    def report(self):
+        s = self.summary()
+        return (f"完成 {s['completed']}，跳过 {s['skipped']}，失败 {s['failed']}，"
+                f"共 {s['bytes'] / (1024 * 1024):.1f} MB，用时 {s['elapsed']:.1f} 秒，"
+                f"{s['files_per_sec']:.1f} 文件/秒，{s['mb_per_sec']:.2f} MB/秒")
+
+
+class ChartDownloader:
+    """基于已登录会话的并发航图下载器"""
+
+    def __init__(self, login, output_dir=None, workers=None, chunk_size=64 * 1024, manifest=None, mount=False):
+        self.login = login
+        self.manifest = manifest  # ChartManifest，下载结果回写到清单
+        self.processor = None     # ChartProcessor，下载完成的文件立即交给进程池校验
+        self.session = login.session
+        config = login.config
+        self.workers = workers or config.getint('download', 'workers', fallback=8)
+        if output_dir is None:
+            output_dir = config.get('download', 'output_dir', fallback='charts')
+        self.output_dir = login.resolve_path(output_dir)
+        self.chunk_size = chunk_size
+        self.timeout = login.timeout
+        self.policy = login.policy
+        self.progress_interval = 100
+
+        # 会话的连接池由EaipLogin按配置的线程数挂载一次；mount=True时按本下载器的线程数重新挂载，
+        # 会替换共享会话的连接池，只能在没有其他线程使用会话时使用（如命令行下载开始前）
+        if mount:
+            login.mount_adapter(pool_connections=4, pool_maxsize=self.workers)
+
+    def fetch_url(self, url):
+        """实际请求的地址：按相对路径拼接到当前配置的服务器地址上"""
+        return f"{self.login.base_url}/{url_to_relpath(url)}"
+
+    def local_path(self, url):
+        """URL对应的本地文件路径"""
+        return local_path(self.output_dir, url)
+
+    @staticmethod
+    def _load_journal(journal_path, url):
+        """读取断点续传日志，URL不一致或损坏时返回None"""
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return journal if journal.get('url') == url else None
+
+    @staticmethod
+    def _save_journal(journal_path, journal):
+        tmp_path = journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(journal, f)
+        os.replace(tmp_path, journal_path)
+
+    @staticmethod
+    def _discard_partial(part, journal_path):
+        for path in (part, journal_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _total_size(response, offset):
+        """从响应头推算完整文件长度"""
+        if response.status_code == 206:
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rpartition('/')[2]
+            return int(total) if total.isdigit() else None
+        length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+
+    def _fetch_to_file(self, url, dest):
+        """以流式分块方式下载到.part文件，支持断点续传，校验通过后原子替换
+
+        .part.json日志记录URL、ETag/Last-Modified和完整长度；中断后用Range请求从已有字节处继续，
+        服务器文件已变化（If-Range不匹配）时会返回完整内容并从头写入。
+        建立连接和可重试状态码由共享的HttpPolicy处理；这里只重试读取响应体时断开的情况。
+        """
+        part = dest + '.part'
+        journal_path = part + '.json'
+        journal = self._load_journal(journal_path, url) if os.path.exists(part) else None
+        if journal is None:
+            self._discard_partial(part, journal_path)
+            journal = {'url': url}
+
+        attempt = 0
+        received = 0
+        while True:
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            # Range按编码后的字节计算，PDF不压缩传输可以保证续传位置准确
+            headers = {'Accept-Encoding': 'identity'}
+            if offset:
+                headers['Range'] = f"bytes={offset}-"
+                validator = journal.get('etag') or journal.get('last_modified')
+                if validator:
+                    headers['If-Range'] = validator
+
+            with self.login._request('GET', self.fetch_url(url), stream=True, timeout=self.timeout,
+                                     headers=headers) as response:
+                if response.status_code == 416 and offset and offset == journal.get('total'):
+                    break  # 之前已完整下载，只差校验和改名
+                if response.status_code not in (200, 206):
+                    if response.status_code == 416:
+                        self._discard_partial(part, journal_path)
+                    raise RequestException(f"状态码: {response.status_code}")
+                if response.status_code == 206:
+                    start = response.headers.get('Content-Range', '').split(' ')[-1].split('-')[0]
+                    if start != str(offset):
+                        raise RequestException(f"续传位置不符: {response.headers.get('Content-Range')}")
+                    mode = 'ab'
+                    if offset:
+                        print(f"从 {offset} 字节处继续下载: {url}")
+                else:
+                    # 完整内容从头写入，之前几次尝试收到的字节都被丢弃，不计入本次下载量
+                    mode, offset, received = 'wb', 0, 0
+
+                journal.update({
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'total': self._total_size(response, offset),
+                })
+                self._save_journal(journal_path, journal)
+
+                try:
+                    with open(part, mode) as f:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            if chunk:
+                                f.write(chunk)
+                                received += len(chunk)
+                    break
+                except RETRY_EXCEPTIONS + (ChunkedEncodingError,) as e:
+                    self.policy.breaker.record_failure()
+                    attempt += 1
+                    if attempt > self.policy.max_retries:
+                        raise
+                    delay = self.policy.backoff(attempt - 1)
+                    print(f"下载中断，{delay:.1f}秒后进行第{attempt}次续传: {str(e)}")
+            time.sleep(delay)
+
+        error = verify_file(part, journal.get('total'))
+        if error:
+            self._discard_partial(part, journal_path)
+            raise RequestException(f"文件校验失败: {error}")
+        os.replace(part, dest)
+        self._discard_partial(part, journal_path)
+        return received
+
+    def download_one(self, name, url):
+        """下载单个航图，返回 (状态, 字节数)"""
+        dest = self.local_path(url)
+        if os.path.exists(dest) and os.path.getsize(dest) > 0:
+            return 'skipped', 0
+        start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            size = self._fetch_to_file(url, dest)
+            metrics.observe('eaip_chart_download_seconds', time.perf_counter() - start)
+            metrics.inc('eaip_chart_downloads_total', status='ok')
+            return 'ok', size
+        except Exception as e:
+            print(f"下载失败 {name}: {str(e)}")
+            metrics.inc('eaip_chart_downloads_total', status='failed')
+            return 'failed', 0
+
+    def record(self, url, status):
+        """将下载结果写入清单；已存在的文件同样记为完成。新下载的文件随后交给后处理流水线"""
+        if self.manifest is not None:
+            dest = self.local_path(url)
+            if status in ('ok', 'skipped'):
+                # 文件可能已被后处理隔离，此时保留清单中的状态
+                if os.path.exists(dest):
+                    self.manifest.mark(url, 'ok', os.path.getsize(dest))
+            else:
+                self.manifest.mark(url, 'failed')
+        if self.processor is not None:
+            if status == 'ok':
+                self.processor.submit(url, self.local_path(url))
+            self.processor.collect()
+
+    def download_all(self, tasks):
+        """并发下载全部航图，返回统计信息"""
+        stats = DownloadStats()
+        if not tasks:
+            print("没有需要下载的航图")
+            return stats.summary()
+
+        print(f"开始下载 {len(tasks)} 个航图，线程数: {self.workers}")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.download_one, name, url): url for name, url in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                status, size = future.result()
+                stats.add(status, size)
+                self.record(futures[future], status)
+                if done % self.progress_interval == 0:
+                    print(f"进度 {done}/{len(tasks)}: {stats.report()}")
+        if self.manifest is not None:
+            self.manifest.commit()
+
+        print(f"下载结束: {stats.report()}")
+        return stats.summary()
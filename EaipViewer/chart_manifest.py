@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import time
+from aip_index import AipIndex
+from chart_downloader import normalize_url
+
+
+class ManifestWriter:
+    """一次过滤过程的清单写入器，逐条写入并定期提交
+
+    结束时删除本版本中本次未出现的节点，使清单与最新过滤结果一致。
+    """
+
+    def __init__(self, manifest, package_info, batch_size=500):
+        self.manifest = manifest
+        self.version = ChartManifest.version_of(package_info)
+        self.batch_size = batch_size
+        self.seen = set()
+        self.pending = 0
+
+    def add(self, item, icao, url):
+        node_id = item.get('id')
+        if not node_id or node_id in self.seen:
+            return
+        self.seen.add(node_id)
+        self.manifest.conn.execute(
+            "INSERT INTO manifest (version, node_id, icao, chart_code, name_cn, url, modified, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (version, node_id) DO UPDATE SET "
+            "icao=excluded.icao, chart_code=excluded.chart_code, name_cn=excluded.name_cn, "
+            "modified=excluded.modified, updated_at=excluded.updated_at, "
+            # URL变化说明航图已重新发布，下载状态需要重置
+            "state=CASE WHEN manifest.url = excluded.url THEN manifest.state ELSE 'pending' END, "
+            "size=CASE WHEN manifest.url = excluded.url THEN manifest.size ELSE NULL END, "
+            "sha256=CASE WHEN manifest.url = excluded.url THEN manifest.sha256 ELSE NULL END, "
+            "pages=CASE WHEN manifest.url = excluded.url THEN manifest.pages ELSE NULL END, "
+            "url=excluded.url",
+            (self.version, node_id, icao, AipIndex.chart_code(item), item.get('name_cn') or '',
+             normalize_url(url), int(item.get('Is_Modified') == 'Y'), time.time()))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.manifest.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        conn = self.manifest.conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_nodes (node_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM seen_nodes")
+        conn.executemany("INSERT INTO seen_nodes (node_id) VALUES (?)", ((node_id,) for node_id in self.seen))
+        conn.execute("DELETE FROM manifest WHERE version=? AND node_id NOT IN (SELECT node_id FROM seen_nodes)",
+                     (self.version,))
+        conn.commit()
+        self.pending = 0
+
+    def abort(self):
+        """过滤中途失败时结束写入：提交已写入的行，但不删除本次未出现的节点"""
+        self.manifest.conn.commit()
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ChartManifest:
+    """结构化航图清单（SQLite），取代只能整体重写的 pdf_paths.txt
+
+    每行对应一个命中过滤规则且带PDF的节点：节点id、ICAO、航图编号、规范化URL、
+    版本（dataName）以及下载状态（pending / ok / failed / quarantined）、文件大小和校验值，
+    下载后处理阶段再补充页数、元数据、缩略图和校验错误。
+    过滤时逐条写入，下载器可以直接流式读取待下载任务并回写状态。
+    """
+
+    STATES = ('pending', 'ok', 'failed', 'quarantined')
+    # 后续版本新增的列，打开旧数据库时自动补齐
+    EXTRA_COLUMNS = (('pages', 'INTEGER'), ('meta', 'TEXT'), ('thumbnail', 'TEXT'), ('error', 'TEXT'))
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS manifest (
+                version TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                icao TEXT,
+                chart_code TEXT,
+                name_cn TEXT,
+                url TEXT NOT NULL,
+                modified INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'pending',
+                size INTEGER,
+                sha256 TEXT,
+                updated_at REAL,
+                PRIMARY KEY (version, node_id)
+            );
+            CREATE INDEX IF NOT EXISTS manifest_url ON manifest (url);
+            CREATE INDEX IF NOT EXISTS manifest_icao ON manifest (version, icao);
+        """)
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(manifest)")}
+        for name, kind in self.EXTRA_COLUMNS:
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE manifest ADD COLUMN {name} {kind}")
+        self.conn.commit()
+
+    @classmethod
+    def from_config(cls, login):
+        return cls(login.resolve_path(login.config.get('manifest', 'db_path', fallback='manifest.db')))
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def version_of(package_info):
+        return (package_info or {}).get('dataName') or ''
+
+    def writer(self, package_info):
+        """返回写入器，用于 filter_content / stream_filter 的manifest参数"""
+        return ManifestWriter(self, package_info)
+
+    def rows(self, package_info, states=None, icao=None):
+        """流式读取清单记录（字典），可按下载状态和ICAO筛选"""
+        sql = ("SELECT node_id, icao, chart_code, name_cn, url, modified, state, size, sha256, pages, error "
+               "FROM manifest WHERE version=?")
+        params = [self.version_of(package_info)]
+        if states:
+            sql += f" AND state IN ({','.join('?' * len(states))})"
+            params.extend(states)
+        if icao:
+            sql += " AND icao=?"
+            params.append(icao.upper())
+        sql += " ORDER BY rowid"
+        columns = ('id', 'icao', 'chart_code', 'name_cn', 'url', 'modified', 'state', 'size', 'sha256',
+                   'pages', 'error')
+        for row in self.conn.execute(sql, params):
+            yield dict(zip(columns, row))
+
+    def tasks(self, package_info, states=None):
+        """下载任务 (名称, URL)，同一URL只出现一次"""
+        seen = set()
+        for row in self.rows(package_info, states):
+            if row['url'] not in seen:
+                seen.add(row['url'])
+                yield row['name_cn'], row['url']
+
+    def mark(self, url, state, size=None, sha256=None):
+        """回写下载状态（同一URL的所有节点一起更新）"""
+        self.conn.execute(
+            "UPDATE manifest SET state=?, size=COALESCE(?, size), sha256=COALESCE(?, sha256), updated_at=? "
+            "WHERE url=?", (state, size, sha256, time.time(), url))
+
+    def record_check(self, url, state, result):
+        """写入下载后处理（校验、页数、元数据、缩略图）的结果"""
+        self.conn.execute(
+            "UPDATE manifest SET state=?, size=?, sha256=?, pages=?, meta=?, thumbnail=?, error=?, updated_at=? "
+            "WHERE url=?",
+            (state, result.get('size'), result.get('sha256'), result.get('pages'),
+             json.dumps(result.get('meta') or {}, ensure_ascii=False), result.get('thumbnail'),
+             result.get('error'), time.time(), url))
+
+    def commit(self):
+        self.conn.commit()
+
+    def counts(self, package_info):
+        """各下载状态的记录数"""
+        rows = self.conn.execute("SELECT state, COUNT(*) FROM manifest WHERE version=? GROUP BY state",
+                                 (self.version_of(package_info),))
+        return dict(rows)
@@ -0,0 +1,179 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from chart_downloader import url_to_relpath
+
+
+class ChartPack:
+    """单文件航图包：一个package的全部航图顺序写入一个文件，末尾附带偏移索引
+
+    文件结构：32字节文件头（魔数、格式版本、索引偏移和长度）+ 各航图内容 + JSON索引。
+    索引按相对路径、节点id、ICAO和航图编号查找文件的 (偏移, 长度)。
+    读取时整个文件用mmap映射，get系列方法返回memoryview切片，不复制数据；
+    拷贝一个周期的数据只需复制一个文件，打开一张航图只需一次字典查找。
+    """
+
+    MAGIC = b'EAIPPACK'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIIQQ')  # 魔数、版本、保留、索引偏移、索引长度
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件无法映射
+            self.file.close()
+            raise ValueError(f"不是有效的航图包: {path}")
+        magic, version, _, index_offset, index_size = self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError(f"不是有效的航图包: {path}")
+        index = json.loads(self.mm[index_offset:index_offset + index_size])
+        self.package = index.get('package') or {}
+        self.created = index.get('created')
+        self.files = index['files']  # [相对路径, 偏移, 长度, sha256, 名称]
+        self.paths = {entry[0]: i for i, entry in enumerate(self.files)}
+        self.nodes = index.get('nodes', {})
+        self.codes = index.get('codes', {})
+        self.icao = index.get('icao', {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.files)
+
+    def close(self):
+        try:
+            self.mm.close()
+        except BufferError:
+            # 仍有memoryview引用映射区时无法关闭，由垃圾回收在引用释放后处理
+            pass
+        self.file.close()
+
+    def _slice(self, i):
+        if i is None:
+            return None
+        _, offset, size = self.files[i][:3]
+        return memoryview(self.mm)[offset:offset + size]
+
+    def entry(self, relpath):
+        """相对路径对应的索引项 (相对路径, 偏移, 长度, sha256, 名称)，不存在时返回None"""
+        i = self.paths.get(relpath.lstrip('/'))
+        return None if i is None else self.files[i]
+
+    def get(self, relpath):
+        """按相对路径（即url_to_relpath的结果，如 packageFile/BASELINE/2025-02/EAIP2025-02.V1.5/Terminal/ZBAA/xxx.pdf）读取"""
+        return self._slice(self.paths.get(relpath.lstrip('/')))
+
+    def get_node(self, node_id):
+        return self._slice(self.nodes.get(node_id))
+
+    def get_chart(self, code):
+        """按航图编号（如 ZBAA-20A）读取"""
+        return self._slice(self.codes.get(code.upper()))
+
+    def airport(self, icao):
+        """机场的全部文件，返回索引项列表"""
+        return [self.files[i] for i in self.icao.get(icao.upper(), [])]
+
+    @classmethod
+    def build(cls, path, manifest, package_info, downloader):
+        """将清单中已下载（状态为ok）的航图写成航图包，返回写入的文件数
+
+        同一URL只写入一次，先写到临时文件，完成后原子替换。
+        """
+        files, paths, nodes, codes, icao_map = [], {}, {}, {}, {}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(b'\0' * cls.HEADER.size)
+            offset = cls.HEADER.size
+            for row in manifest.rows(package_info, states=('ok',)):
+                relpath = url_to_relpath(row['url'])
+                i = paths.get(relpath)
+                if i is None:
+                    src = downloader.local_path(row['url'])
+                    digest = hashlib.sha256()
+                    try:
+                        with open(src, 'rb') as f:
+                            while True:
+                                chunk = f.read(1024 * 1024)
+                                if not chunk:
+                                    break
+                                digest.update(chunk)
+                                out.write(chunk)
+                    except OSError as e:
+                        print(f"跳过无法读取的文件 {relpath}: {str(e)}")
+                        out.seek(offset)
+                        out.truncate()
+                        continue
+                    size = out.tell() - offset
+                    i = paths[relpath] = len(files)
+                    files.append([relpath, offset, size, digest.hexdigest(), row['name_cn']])
+                    offset += size
+                nodes[row['id']] = i
+                if row['chart_code']:
+                    codes.setdefault(row['chart_code'].upper(), i)
+                if row['icao']:
+                    members = icao_map.setdefault(row['icao'], [])
+                    if i not in members:
+                        members.append(i)
+
+            index = json.dumps({
+                'package': package_info or {},
+                'created': time.time(),
+                'files': files,
+                'nodes': nodes,
+                'codes': codes,
+                'icao': icao_map,
+            }, ensure_ascii=False).encode('utf-8')
+            out.write(index)
+            out.seek(0)
+            out.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, 0, offset, len(index)))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+        print(f"航图包已生成 {path}: {len(files)} 个文件，{offset / (1024 * 1024):.1f} MB")
+        return len(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看或提取单文件航图包")
+    parser.add_argument('pack', help="航图包路径")
+    parser.add_argument('key', nargs='?', default=None, help="航图编号（如 ZBAA-20A）、ICAO、节点id或相对路径")
+    parser.add_argument('--output', default=None, metavar='PATH', help="将航图写入该文件")
+    args = parser.parse_args()
+
+    with ChartPack(args.pack) as pack:
+        if not args.key:
+            total = sum(entry[2] for entry in pack.files)
+            print(f"{pack.package.get('dataName', 'unknown')}: {len(pack)} 个文件，{total / (1024 * 1024):.1f} MB，"
+                  f"{len(pack.icao)} 个机场")
+            return
+        if pack.icao.get(args.key.upper()):
+            for relpath, _, size, _, name in pack.airport(args.key):
+                print(f"- {name} ({size} 字节): {relpath}")
+            return
+        data = pack.get_chart(args.key) or pack.get_node(args.key) or pack.get(args.key)
+        if data is None:
+            print(f"未找到: {args.key}")
+            return
+        if args.output:
+            with open(args.output, 'wb') as f:
+                f.write(data)
+            print(f"已写入 {args.output}（{len(data)} 字节）")
+        else:
+            print(f"{args.key}: {len(data)} 字节")
+        data.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import re
+import shutil
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait as wait_all
+from io import BytesIO
+from PIL import Image
+from chart_downloader import verify_pdf
+
+PAGES_COUNT = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)', re.S)
+PAGE_OBJECT = re.compile(rb'/Type\s*/Page\b(?!s)')
+OBJECT_STREAM = re.compile(rb'/Type\s*/ObjStm\b.*?>>\s*stream\r?\n', re.S)
+INFO_FIELD = re.compile(rb'/(Title|Author|Producer|Creator|CreationDate|ModDate)\s*\(((?:\\.|[^\\)])*)\)')
+IMAGE_STREAM = re.compile(rb'<<((?:(?!>>\s*stream).){0,1024}?/DCTDecode(?:(?!>>\s*stream).){0,1024}?)>>\s*stream\r?\n', re.S)
+
+
+def _object_streams(data):
+    """解压PDF 1.5+的对象流，页数等信息可能只存在于其中"""
+    for match in OBJECT_STREAM.finditer(data):
+        end = data.find(b'endstream', match.end())
+        if end < 0:
+            continue
+        try:
+            yield zlib.decompress(data[match.end():end].rstrip(b'\r\n'))
+        except zlib.error:
+            continue
+
+
+def page_count(data):
+    """读取页树根节点的/Count，找不到时统计/Type /Page对象"""
+    for chunk in [data] + list(_object_streams(data)):
+        counts = [int(value) for value in PAGES_COUNT.findall(chunk)]
+        if counts:
+            return max(counts)
+    pages = len(PAGE_OBJECT.findall(data))
+    pages += sum(len(PAGE_OBJECT.findall(chunk)) for chunk in _object_streams(data))
+    return pages or None
+
+
+def pdf_metadata(data):
+    """从文档信息字典中读取标题、生成工具和日期等字段"""
+    meta = {}
+    header = data[:16]
+    if header.startswith(b'%PDF-'):
+        meta['version'] = header[5:8].decode('ascii', 'replace')
+    for key, value in INFO_FIELD.findall(data):
+        meta.setdefault(key.decode('ascii'), value.decode('latin-1'))
+    return meta
+
+
+def largest_jpeg(data):
+    """返回PDF中最大的JPEG（DCTDecode）图像数据，没有时返回None"""
+    best = None
+    for match in IMAGE_STREAM.finditer(data):
+        end = data.find(b'endstream', match.end())
+        if end < 0:
+            continue
+        stream = data[match.end():end].rstrip(b'\r\n')
+        if stream.startswith(b'\xff\xd8') and (best is None or len(stream) > len(best)):
+            best = stream
+    return best
+
+
+def process_file(path, thumb_path=None, thumb_size=(256, 256)):
+    """校验单个航图文件并提取信息（在子进程中运行）
+
+    返回字典：error为None表示文件有效，同时给出大小、sha256、页数、元数据和缩略图路径。
+    只有结构性错误（错误页面、文件头、结束标记、长度）才算无效；页数无法识别（如对象流经过加密或
+    使用了不支持的压缩方式）时pages为None并给出warning，文件仍视为有效，避免反复下载又反复隔离。
+    Pillow无法渲染PDF矢量内容，缩略图取自文件内嵌的最大JPEG图像，没有内嵌图像时不生成。
+    """
+    result = {'path': path, 'error': None, 'warning': None, 'size': None, 'sha256': None,
+              'pages': None, 'meta': {}, 'thumbnail': None}
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        result['error'] = f"无法读取文件: {str(e)}"
+        return result
+
+    result['size'] = len(data)
+    result['sha256'] = hashlib.sha256(data).hexdigest()
+    head = data[:1024].lstrip().lower()
+    if head.startswith((b'<!doctype', b'<html', b'<?xml', b'{')) or b'<html' in head:
+        result['error'] = "内容为HTML/JSON错误页面"
+        return result
+    error = verify_pdf(path)
+    if error:
+        result['error'] = error
+        return result
+
+    result['pages'] = page_count(data)
+    if not result['pages']:
+        result['warning'] = "未能识别页数"
+    result['meta'] = pdf_metadata(data)
+
+    if thumb_path:
+        jpeg = largest_jpeg(data)
+        if jpeg:
+            try:
+                with Image.open(BytesIO(jpeg)) as image:
+                    image.thumbnail(thumb_size)
+                    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                    image.convert('RGB').save(thumb_path, 'JPEG', quality=80)
+                result['thumbnail'] = thumb_path
+            except (OSError, ValueError):
+                pass
+    return result
+
+
+class ChartProcessor:
+    """下载后处理流水线：文件一落盘就提交到进程池校验，与网络下载重叠进行
+
+    结果（大小、sha256、页数、元数据、缩略图）写入航图清单；无效文件移入隔离目录，
+    清单状态记为quarantined，下次下载时会重新获取。
+    """
+
+    def __init__(self, manifest, output_dir, workers=None, thumb_dir=None, quarantine_dir=None,
+                 thumb_size=(256, 256)):
+        self.manifest = manifest
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.thumb_dir = thumb_dir
+        # 隔离目录不能放在下载目录内，否则会被增量同步当作可复用文件
+        self.quarantine_dir = quarantine_dir or output_dir.rstrip('/\\') + '_quarantine'
+        self.thumb_size = thumb_size
+        self.executor = None
+        self.futures = {}     # future -> URL
+        self.done = deque()   # 已完成的future，由进程池的回调线程追加
+        self.stats = {'valid': 0, 'quarantined': 0}
+
+    @classmethod
+    def from_config(cls, login, manifest, output_dir):
+        config = login.config
+        return cls(
+            manifest,
+            output_dir,
+            workers=config.getint('processing', 'workers', fallback=0) or None,
+            thumb_dir=login.resolve_path(config.get('processing', 'thumbnail_dir', fallback='thumbnails')),
+            quarantine_dir=login.resolve_path(config.get('processing', 'quarantine_dir', fallback='quarantine')),
+        )
+
+    def _relpath(self, path):
+        return os.path.relpath(path, self.output_dir)
+
+    def submit(self, url, path):
+        """提交一个已下载的文件"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        thumb_path = None
+        if self.thumb_dir:
+            thumb_path = os.path.join(self.thumb_dir, os.path.splitext(self._relpath(path))[0] + '.jpg')
+        future = self.executor.submit(process_file, path, thumb_path, self.thumb_size)
+        self.futures[future] = url
+        future.add_done_callback(self.done.append)
+
+    def collect(self, wait=False):
+        """处理已完成的结果并写入清单（清单连接只在主线程使用），返回处理数量"""
+        ready = []
+        while self.done:
+            ready.append(self.done.popleft())
+        if wait and self.futures:
+            wait_all(list(self.futures))
+            ready.extend(self.futures)
+
+        count = 0
+        for future in ready:
+            url = self.futures.pop(future, None)
+            if url is None:  # 已经处理过（回调晚于wait返回）
+                continue
+            count += 1
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"处理失败 {url}: {str(e)}")
+                continue
+            self._apply(url, result)
+        if count:
+            self.manifest.commit()
+        return count
+
+    def _apply(self, url, result):
+        if result['error'] is None:
+            if result.get('warning'):
+                print(f"警告 {self._relpath(result['path'])}: {result['warning']}")
+            self.stats['valid'] += 1
+            self.manifest.record_check(url, 'ok', result)
+            return
+        self.stats['quarantined'] += 1
+        print(f"文件无效，已隔离 {self._relpath(result['path'])}: {result['error']}")
+        dest = os.path.join(self.quarantine_dir, self._relpath(result['path']))
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(result['path'], dest)
+        except OSError as e:
+            print(f"隔离文件失败: {str(e)}")
+        self.manifest.record_check(url, 'quarantined', result)
+
+    def finish(self):
+        """等待全部任务完成并关闭进程池"""
+        self.collect(wait=True)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        print(f"航图校验完成: 有效 {self.stats['valid']}，隔离 {self.stats['quarantined']}")
+        return dict(self.stats)
+
+    def process_existing(self, downloader, package_info):
+        """处理清单中已下载但尚未校验的文件（sha256只在校验时写入）"""
+        seen = set()
+        for row in self.manifest.rows(package_info, states=('ok',)):
+            if row['sha256'] is not None or row['url'] in seen:
+                continue
+            seen.add(row['url'])
+            path = downloader.local_path(row['url'])
+            if os.path.exists(path):
+                self.submit(row['url'], path)
@@ -0,0 +1,164 @@
+import json
+import re
+import sqlite3
+from aip_index import AipIndex
+from chart_downloader import chart_url, relative_pdf_path
+
+ASCII_TOKEN = re.compile(r'[A-Za-z0-9]+')
+CJK_RUN = re.compile(r'[一-鿿]+')
+ALPHA_DIGIT = re.compile(r'[A-Z]+|\d+[A-Z]*')
+
+
+def tokenize(text, query=False):
+    """将航图名称切分为检索词
+
+    英文/数字按单词切分并拆出字母与数字部分（RWY35L -> RWY35L, RWY, 35L），
+    中文没有分词边界，文档中同时索引单字和双字，查询时使用双字（单字查询时用单字）。
+    """
+    tokens = []
+    text = str(text or '')
+    for word in ASCII_TOKEN.findall(text):
+        word = word.upper()
+        tokens.append(word)
+        if not query:
+            parts = ALPHA_DIGIT.findall(word)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    for run in CJK_RUN.findall(text):
+        if len(run) == 1 or not query:
+            tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class ChartSearch:
+    """基于SQLite FTS5的本地航图检索索引
+
+    索引按节点id增量更新：新package同步后只重写名称或PDF文件发生变化的记录，
+    并删除已不存在的节点，无需整体重建。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS charts (
+                rowid INTEGER PRIMARY KEY,
+                node_id TEXT UNIQUE NOT NULL,
+                icao TEXT,
+                chart_code TEXT,
+                name TEXT,
+                name_cn TEXT,
+                pdf_path TEXT,
+                signature TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS charts_fts USING fts5(tokens);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    @classmethod
+    def from_config(cls, login):
+        return cls(login.resolve_path(login.config.get('search', 'db_path', fallback='search.db')))
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _rows(index):
+        """从索引生成待检索的记录"""
+        airport_icao = {node_id: icao for icao, node_id in index.icao_map.items()}
+        for node in index:
+            pdf_path = node.get('pdfPath') or ''
+            if not pdf_path:
+                continue
+            node_id = node.get('id')
+            name = node.get('name') or ''
+            name_cn = node.get('name_cn') or ''
+
+            # 机场名称（如 "ZSPD-上海/浦东"）也加入航图的检索词，便于按城市检索
+            icao = node.get('airporticao') or None
+            airport_name = ''
+            for ancestor_id in index.path_ids(node_id):
+                if ancestor_id in airport_icao:
+                    icao = airport_icao[ancestor_id]
+                    if ancestor_id != node_id:
+                        airport_name = index.get(ancestor_id).get('name_cn') or ''
+                    break
+
+            chart_code = AipIndex.chart_code(node) or AipIndex.chart_code({'name': name})
+            rel_path = relative_pdf_path(pdf_path)
+            signature = '\x1f'.join((name, name_cn, rel_path, icao or '', airport_name, chart_code or ''))
+            tokens = tokenize(f"{icao or ''} {name} {name_cn} {airport_name}")
+            yield (node_id, icao, chart_code, name, name_cn, rel_path, signature,
+                   ' '.join(dict.fromkeys(tokens)))
+
+    def update(self, records, package_info):
+        """增量更新索引，返回 (新增, 更新, 删除) 数量"""
+        index = records if isinstance(records, AipIndex) else AipIndex(records)
+        cursor = self.conn.cursor()
+        existing = {node_id: (rowid, signature) for rowid, node_id, signature
+                    in cursor.execute("SELECT rowid, node_id, signature FROM charts")}
+
+        added = updated = 0
+        seen = set()
+        with self.conn:
+            for node_id, icao, code, name, name_cn, rel_path, signature, tokens in self._rows(index):
+                seen.add(node_id)
+                old = existing.get(node_id)
+                if old and old[1] == signature:
+                    continue
+                if old:
+                    rowid = old[0]
+                    cursor.execute(
+                        "UPDATE charts SET icao=?, chart_code=?, name=?, name_cn=?, pdf_path=?, signature=? "
+                        "WHERE rowid=?", (icao, code, name, name_cn, rel_path, signature, rowid))
+                    cursor.execute("DELETE FROM charts_fts WHERE rowid=?", (rowid,))
+                    updated += 1
+                else:
+                    cursor.execute(
+                        "INSERT INTO charts (node_id, icao, chart_code, name, name_cn, pdf_path, signature) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", (node_id, icao, code, name, name_cn, rel_path, signature))
+                    rowid = cursor.lastrowid
+                    added += 1
+                cursor.execute("INSERT INTO charts_fts (rowid, tokens) VALUES (?, ?)", (rowid, tokens))
+
+            removed = [(rowid,) for node_id, (rowid, _) in existing.items() if node_id not in seen]
+            cursor.executemany("DELETE FROM charts WHERE rowid=?", removed)
+            cursor.executemany("DELETE FROM charts_fts WHERE rowid=?", removed)
+
+            if package_info:
+                package = {'filePath': package_info.get('filePath'), 'dataName': package_info.get('dataName')}
+                cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('package', ?)",
+                               (json.dumps(package),))
+
+        print(f"检索索引已更新: 新增 {added}，更新 {updated}，删除 {len(removed)}")
+        return added, updated, len(removed)
+
+    def package_info(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key='package'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def search(self, query, limit=20):
+        """检索航图，返回匹配记录列表（按相关度排序）"""
+        tokens = list(dict.fromkeys(tokenize(query, query=True)))
+        if not tokens:
+            return []
+        match = ' AND '.join('"{}"'.format(token.replace('"', '""')) for token in tokens)
+        rows = self.conn.execute(
+            "SELECT c.node_id, c.icao, c.chart_code, c.name, c.name_cn, c.pdf_path "
+            "FROM charts_fts f JOIN charts c ON c.rowid = f.rowid "
+            "WHERE charts_fts MATCH ? ORDER BY f.rank LIMIT ?", (match, limit)).fetchall()
+
+        package = self.package_info()
+        results = []
+        for node_id, icao, code, name, name_cn, rel_path in rows:
+            results.append({
+                'id': node_id,
+                'icao': icao,
+                'chart_code': code,
+                'name': name,
+                'name_cn': name_cn,
+                'pdfPath': rel_path,
+                'url': chart_url(package, rel_path),
+            })
+        return results
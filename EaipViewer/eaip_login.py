@@ -1,48 +1,48 @@
 import base64
+import json
 import uuid
-from urllib.parse import unquote
+from urllib.parse import unquote, urlparse
 from io import BytesIO
 from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_v1_5
 import configparser
 import time
-from functools import wraps
 from requests.exceptions import RequestException
 import urllib3
 import os
+from aip_stream import iter_json_array
+from http_policy import HttpPolicy
+from http_cache import HttpCache
+from instrumentation import metrics
 
 # 禁用不安全请求警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def retry_on_failure(max_retries=3, delay=1):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retries = 0
-            while retries < max_retries:
-                try:
-                    return func(*args, **kwargs)
-                except RequestException as e:
-                    retries += 1
-                    if retries == max_retries:
-                        print(f"请求失败，已重试{retries}次: {str(e)}")
-                        raise
-                    print(f"请求失败，正在进行第{retries}次重试...")
-                    time.sleep(delay)
-            return None
-        return wrapper
-    return decorator
+DEFAULT_BASE_URL = "https://www.eaipchina.cn/eaip"
 
 class EaipLogin:
-    def __init__(self):
+    def __init__(self, base_url=None):
         self.session = requests.Session()
         self.captcha_id = None
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.config = self._load_config()
+        # 服务器地址，可在config.ini的[server]中修改（例如指向本地模拟服务器做基准测试）
+        self.base_url = (base_url or self.config.get('server', 'base_url', fallback=DEFAULT_BASE_URL)).rstrip('/')
         self.timeout = 30
-        self.max_retries = 3
+        self.session_file = self.resolve_path(self.config.get('session', 'cache_file', fallback='session.json'))
+        self.session_ttl = self.config.getfloat('session', 'ttl_hours', fallback=12) * 3600
+        # 所有请求共享的重试/限速/熔断策略
+        self.policy = HttpPolicy.from_config(self.config)
+        # 为False时（如无人值守的监视模式）会话过期后不弹出验证码输入，只尝试恢复缓存会话
+        self.interactive = True
+        # GET请求的条件请求缓存（ETag/Last-Modified），挂载在会话的传输适配器上；
+        # 连接池大小与默认下载线程数一致，只在此处挂载一次，之后各线程共享
+        self.http_cache = HttpCache.from_config(self)
+        self.mount_adapter(pool_connections=4,
+                           pool_maxsize=self.config.getint('download', 'workers', fallback=8))
         
         # 更新所有默认请求头
         self.session.headers.update({
@@ -62,6 +62,9 @@ class EaipLogin:
             'sec-ch-ua-platform': '"Windows"'
         })
         
+        if urlparse(self.base_url).hostname != 'www.eaipchina.cn':
+            self.session.headers.pop('Host', None)
+        
         # 设置HTTPS验证选项
         self.session.verify = False
         
@@ -84,6 +87,27 @@ class EaipLogin:
             raise
         return config
         
+    def resolve_path(self, path):
+        """配置中的相对路径按程序目录（base_dir）解析，空值原样返回"""
+        if path and not os.path.isabs(path):
+            path = os.path.join(self.base_dir, path)
+        return path
+
+    def mount_adapter(self, **kwargs):
+        """为会话挂载传输适配器（启用缓存时带条件请求缓存），kwargs为连接池参数"""
+        if self.http_cache is not None:
+            adapter = self.http_cache.adapter(**kwargs)
+        else:
+            adapter = HTTPAdapter(**kwargs)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        return adapter
+
+    def _request(self, method, url, **kwargs):
+        """通过共享策略发送请求"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.policy.request(self.session, method, url, **kwargs)
+
     def set_login_cookie(self, name, value):
         """设置登录Cookie和Token"""
         self.session.cookies.set(name, value, domain='www.eaipchina.cn')
@@ -94,6 +118,94 @@ class EaipLogin:
         elif name == "userid":
             self.session.cookies.set("userId", value, domain='www.eaipchina.cn')
     
+    @staticmethod
+    def _token_expiry(token):
+        """尝试从JWT格式的token中读取过期时间，无法解析时返回None"""
+        try:
+            parts = token.split('.')
+            if len(parts) != 3:
+                return None
+            payload = parts[1] + '=' * (-len(parts[1]) % 4)
+            exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+            return float(exp) if exp else None
+        except Exception:
+            return None
+
+    def save_session(self, token, user_uuid):
+        """将token和userId保存到本地缓存文件"""
+        now = time.time()
+        expires_at = self._token_expiry(token) or now + self.session_ttl
+        data = {
+            'token': token,
+            'userId': user_uuid,
+            'saved_at': now,
+            'expires_at': expires_at
+        }
+        try:
+            tmp_path = self.session_file + '.tmp'
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.session_file)
+        except OSError as e:
+            print(f"保存会话缓存失败: {str(e)}")
+
+    def load_session(self):
+        """读取本地会话缓存，过期或无效时返回None"""
+        try:
+            with open(self.session_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not data.get('token') or not data.get('userId'):
+            return None
+        if data.get('expires_at', 0) <= time.time():
+            print("本地会话缓存已过期")
+            self.clear_session()
+            return None
+        return data
+
+    def clear_session(self):
+        """删除本地会话缓存"""
+        try:
+            os.remove(self.session_file)
+        except OSError:
+            pass
+
+    def restore_session(self):
+        """从缓存恢复登录状态，并用一次轻量请求验证是否仍然有效"""
+        data = self.load_session()
+        if not data:
+            return False
+        self.set_login_cookie("userid", data['userId'])
+        self.set_login_cookie("username", data['token'])
+
+        result = self.validate_admin()
+        if result is None:
+            print("无法验证缓存的会话")
+            return False
+        if not self.check_login_status(result):
+            return False
+        print("已使用缓存的会话，跳过验证码登录")
+        return True
+
+    def ensure_login(self):
+        """优先复用缓存会话，失效时再执行交互式登录"""
+        if self.restore_session():
+            return True
+        self.session.headers.pop('token', None)
+        self.session.cookies.clear()
+        return self.login()
+
+    def relogin(self):
+        """会话过期后重新登录：先尝试缓存会话（可能已被其他进程更新），非交互模式下不再输入验证码"""
+        if self.restore_session():
+            return True
+        if not self.interactive:
+            print("会话已过期，非交互模式下无法输入验证码，请手动运行一次登录")
+            return False
+        return self.login()
+
     def encrypt_password(self, password):
         """RSA加密密码"""
         public_key = '''-----BEGIN PUBLIC KEY-----
@@ -110,24 +222,23 @@ class EaipLogin:
         encrypted_b64 = base64.b64encode(encrypted).decode('utf-8')
         return unquote(encrypted_b64)
 
-    @retry_on_failure(max_retries=3, delay=2)  # 增加重试间隔
     def get_captcha(self):
         """获取验证码图片"""
         self.captcha_id = str(uuid.uuid4())
-        captcha_url = f"https://www.eaipchina.cn/eaip/login/captcha?captchaId={self.captcha_id}"
-        return self.session.get(
+        captcha_url = f"{self.base_url}/login/captcha?captchaId={self.captcha_id}"
+        return self._request(
+            'GET',
             captcha_url,
             timeout=self.timeout,
             allow_redirects=True
         )
     
-    @retry_on_failure(max_retries=3, delay=2)
     def login_with_captcha(self, username, password, captcha_text):
         """使用验证码登录"""
         if not self.captcha_id:
             return False
             
-        login_url = "https://www.eaipchina.cn/eaip/login/login"
+        login_url = f"{self.base_url}/login/login"
         login_data = {
             "username": username,
             "password": self.encrypt_password(password),
@@ -136,7 +247,8 @@ class EaipLogin:
         }
         
         try:
-            response = self.session.post(
+            response = self._request(
+                'POST',
                 login_url,
                 json=login_data,
                 timeout=self.timeout,
@@ -156,18 +268,19 @@ class EaipLogin:
             user_uuid = data["data"]["eaipUserUuid"]
             self.set_login_cookie("userid", user_uuid)
             self.set_login_cookie("username", token)
+            self.save_session(token, user_uuid)
             return True
             
         except RequestException as e:
             print(f"登录请求异常: {str(e)}")
             return False
 
-    @retry_on_failure(max_retries=3, delay=2)
     def get_publication_list(self):
         """获取航行资料列表"""
-        url = "https://www.eaipchina.cn/eaip/publication/listByLoginPage"
+        url = f"{self.base_url}/publication/listByLoginPage"
         try:
-            response = self.session.post(
+            response = self._request(
+                'POST',
                 url,
                 json={},  # 空JSON请求体
                 timeout=self.timeout,
@@ -185,36 +298,47 @@ class EaipLogin:
         if isinstance(response_data, dict):
             if response_data.get('retCode') == 0 and 'login has expired' in str(response_data.get('retMsg', '')):
                 print("会话已过期，尝试重新登录...")
+                self.clear_session()
                 return False
         return True
 
-    @retry_on_failure(max_retries=3, delay=2)
+    @staticmethod
+    def _has_package_data(data):
+        """判断listPage返回中是否已包含package列表"""
+        if not isinstance(data, dict) or data.get('retCode') == 0:
+            return False
+        inner = data.get('data')
+        return isinstance(inner, dict) and bool(inner.get('data'))
+
     def get_package_list(self):
         """获取包列表"""
-        url = "https://www.eaipchina.cn/eaip/package/listPage"
+        url = f"{self.base_url}/package/listPage"
         try:
             headers = {
                 'Content-Type': 'application/json',
                 'Content-Length': '0'
             }
             # 第一次访问获取初始数据
-            first_response = self.session.post(url, json={}, timeout=self.timeout, headers=headers)
+            first_response = self._request('POST', url, json={}, timeout=self.timeout, headers=headers)
             if first_response.status_code != 200:
                 print(f"第一次请求失败，状态码: {first_response.status_code}")
                 return None
             
             first_data = first_response.json()
             if not self.check_login_status(first_data):
-                if not self.login():
+                if not self.relogin():
                     return None
                 # 重新尝试获取包列表
-                first_response = self.session.post(url, json={}, timeout=self.timeout, headers=headers)
+                first_response = self._request('POST', url, json={}, timeout=self.timeout, headers=headers)
+            elif self._has_package_data(first_data):
+                # 会话有效时第一次请求即返回完整数据，无需预热请求和等待
+                return first_data
                 
             print("等待1秒后重试...")
             time.sleep(1)
             
             # 第二次访问获取实际数据
-            response = self.session.post(url, json={}, timeout=self.timeout, headers=headers)
+            response = self._request('POST', url, json={}, timeout=self.timeout, headers=headers)
             if response.status_code != 200:
                 print(f"第二次请求失败，状态码: {response.status_code}")
                 return None
@@ -227,7 +351,7 @@ class EaipLogin:
             if data.get('retCode') == 0:
                 print(f"获取数据失败: {data.get('retMsg', '未知错误')}")
                 if 'login has expired' in str(data.get('retMsg', '')):
-                    if self.login():
+                    if self.relogin():
                         # 重新尝试获取包列表
                         return self.get_package_list()
                 return None
@@ -238,67 +362,6 @@ class EaipLogin:
             print(f"获取包列表失败: {str(e)}")
             return None
 
-    def get_current_aip_structure(self):
-        """获取当前版本的AIP目录结构"""
-        for attempt in range(2):  # 最多尝试2次
-            try:
-                print("正在获取包列表...")
-                packages = self.get_package_list()
-                if not packages:
-                    if attempt == 0:
-                        print("尝试重新登录...")
-                        if self.login():
-                            continue
-                    print("获取包列表失败")
-                    return None
-                
-                if not isinstance(packages, dict):
-                    print(f"包列表数据格式错误: {type(packages)}")
-                    return None
-                    
-                print("解析包列表数据...")
-                data = packages.get("data")
-                if not data:
-                    print("data字段为空")
-                    return None
-                    
-                package_list = data.get("data")
-                if not package_list:
-                    print("没有找到包列表数据")
-                    return None
-                    
-                print("查找当前生效版本...")
-                # 获取当前生效的版本
-                current_package = None
-                for pkg in package_list:
-                    if pkg.get("dataStatus") == "CURRENTLY_ISSUE":
-                        current_package = pkg
-                        break
-                
-                if not current_package:
-                    print("未找到当前生效版本")
-                    return None
-                    
-                print(f"找到当前版本: {current_package.get('dataName', 'unknown')}")
-                print("正在获取AIP.JSON...")
-                
-                json_data = self.get_aip_json(current_package)
-                if not json_data:
-                    print("获取AIP.JSON失败")
-                    return None
-                    
-                return json_data
-                
-            except Exception as e:
-                print(f"获取目录结构时发生错误: {str(e)}")
-                if attempt == 0:
-                    print("尝试重新登录...")
-                    if self.login():
-                        continue
-                return None
-        return None
-
-    @retry_on_failure(max_retries=3, delay=2)
     def get_pdf_url(self, package_info, pdf_path):
         """构建PDF文件的完整URL"""
         try:
@@ -307,7 +370,7 @@ class EaipLogin:
             if not base_path or not version or not pdf_path:
                 return None
                 
-            url = f"https://www.eaipchina.cn/eaip/{base_path}/{version}/{pdf_path}"
+            url = f"{self.base_url}/{base_path}/{version}/{pdf_path}"
             return url
             
         except Exception as e:
@@ -329,21 +392,21 @@ class EaipLogin:
             pass
         return None
 
-    @retry_on_failure(max_retries=3, delay=2)
     def get_aip_json(self, package_info):
         """获取AIP.JSON文件内容"""
         try:
             # 使用固定格式的URL
             base_path = package_info["filePath"]
-            url = f"https://www.eaipchina.cn/eaip/{base_path}/JsonPath/AIP.JSON"
+            url = f"{self.base_url}/{base_path}/JsonPath/AIP.JSON"
             print(f"正在获取AIP数据: {url}")
             
-            response = self.session.get(url, timeout=self.timeout)
+            response = self._request('GET', url, timeout=self.timeout)
             if response.status_code != 200:
                 print(f"获取AIP.JSON失败, 状态码: {response.status_code}")
                 return None
                 
-            data = response.json()
+            with metrics.timer('json_decode'):
+                data = response.json()
             if not data:
                 print("获取到的AIP数据为空")
                 return None
@@ -354,15 +417,26 @@ class EaipLogin:
             print(f"获取AIP.JSON失败: {str(e)}")
             return None
 
-    @retry_on_failure(max_retries=3, delay=2)
+    def iter_aip_json(self, package_info, chunk_size=64 * 1024):
+        """流式获取AIP.JSON，边下载边逐条产出记录"""
+        base_path = package_info["filePath"]
+        url = f"{self.base_url}/{base_path}/JsonPath/AIP.JSON"
+        print(f"正在流式获取AIP数据: {url}")
+
+        with self._request('GET', url, timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200:
+                print(f"获取AIP.JSON失败, 状态码: {response.status_code}")
+                return
+            yield from iter_json_array(response.iter_content(chunk_size=chunk_size))
+
     def validate_admin(self):
         """验证管理员权限"""
-        url = "https://www.eaipchina.cn/eaip/user/validSuperAdmin"
+        url = f"{self.base_url}/user/validSuperAdmin"
         headers = {
             'Content-Length': '0'
         }
         try:
-            response = self.session.post(url, data="", headers=headers, timeout=self.timeout)
+            response = self._request('POST', url, data="", headers=headers, timeout=self.timeout)
             if response.status_code != 200:
                 print(f"验证管理员权限失败，状态码: {response.status_code}")
                 return None
@@ -0,0 +1,30 @@
+import json
+import os
+from io import BytesIO
+from PIL import Image
+
+
+def load_json(path):
+    """读取JSON文件，文件不存在或内容损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data, indent=None):
+    """先写临时文件再os.replace，读取方不会看到写了一半的内容"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def blank_jpeg(size=(80, 30), color=(230, 230, 230)):
+    """纯色JPEG图像，供本地服务器作为验证码等占位图片返回"""
+    buf = BytesIO()
+    Image.new('RGB', size, color).save(buf, 'JPEG')
+    return buf.getvalue()
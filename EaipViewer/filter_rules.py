@@ -0,0 +1,88 @@
+import re
+
+
+class FilterRule:
+    """单条预编译的过滤规则"""
+
+    def __init__(self, name, kind, pattern, requires=None):
+        if kind not in ('contains', 'regex'):
+            raise ValueError(f"未知的规则类型: {kind}")
+        self.name = name
+        self.kind = kind
+        self.pattern = pattern
+        self.requires = requires
+        self.regex = re.compile(pattern) if kind == 'regex' else None
+
+    def matches(self, text, flags):
+        if self.requires and self.requires not in flags:
+            return False
+        if self.regex is not None:
+            return self.regex.match(text) is not None
+        return self.pattern in text
+
+    @classmethod
+    def parse(cls, name, spec):
+        """解析配置格式: contains:文本 或 regex:正则，可追加 " @标记" 要求祖先带有该标记"""
+        requires = None
+        if ' @' in spec:
+            spec, requires = spec.rsplit(' @', 1)
+            requires = requires.strip() or None
+        kind, _, pattern = spec.partition(':')
+        return cls(name, kind.strip(), pattern.strip(), requires)
+
+
+class FilterRules:
+    """编译后的过滤规则集
+
+    标记（flag）在节点命中后沿子树向下继承，因此判断祖先条件是O(1)操作，
+    不需要在每个节点重新扫描整条祖先路径。
+    """
+
+    DEFAULT_FLAGS = [
+        ('aerodrome', 'contains', '机场清单'),
+    ]
+    DEFAULT_RULES = [
+        ('enr6', 'contains', 'ENR 6', None),
+        ('ad2', 'contains', 'AD 2 机场清单', None),
+        ('chart', 'regex', r'Z[PBGHLSUWY][A-Z]{2}-\d[A-Z]?\d?\d?', 'aerodrome'),
+        ('icao', 'regex', r'Z[PBGHLSUWY][A-Z]{2}', None),
+    ]
+
+    def __init__(self, rules=None, flags=None):
+        if rules is None:
+            rules = [FilterRule(*spec) for spec in self.DEFAULT_RULES]
+        if flags is None:
+            flags = [FilterRule(*spec) for spec in self.DEFAULT_FLAGS]
+        self.rules = rules
+        self.flags = flags
+        self.hits = {rule.name: 0 for rule in self.rules}
+
+    @classmethod
+    def from_config(cls, config):
+        """从config.ini的[filter_rules]/[filter_flags]读取规则，未配置时使用默认规则"""
+        rules = flags = None
+        if config is not None and config.has_section('filter_rules'):
+            rules = [FilterRule.parse(name, spec) for name, spec in config.items('filter_rules')]
+        if config is not None and config.has_section('filter_flags'):
+            flags = [FilterRule.parse(name, spec) for name, spec in config.items('filter_flags')]
+        return cls(rules, flags)
+
+    def reset_hits(self):
+        self.hits = {rule.name: 0 for rule in self.rules}
+
+    def evaluate(self, name_cn, inherited=frozenset()):
+        """返回 (命中的规则名或None, 传递给子节点的标记集合)"""
+        text = str(name_cn)
+        flags = inherited
+        for flag in self.flags:
+            if flag.name not in flags and flag.matches(text, flags):
+                flags = flags | {flag.name}
+
+        for rule in self.rules:
+            if rule.matches(text, flags):
+                self.hits[rule.name] += 1
+                return rule.name, flags
+        return None, flags
+
+    def summary(self):
+        return "，".join(f"{name}={count}" for name, count in self.hits.items())
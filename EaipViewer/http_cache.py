@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from instrumentation import metrics
+
+
+class HttpCache:
+    """持久化的条件请求缓存：保存响应体及其ETag/Last-Modified，再次请求时发送If-None-Match/If-Modified-Since
+
+    缓存键为eaip根路径下的相对路径（以package的filePath开头，如
+    packageFile/BASELINE/2025-02/.../JsonPath/AIP.JSON），与服务器地址无关，切换到镜像后仍然有效。
+    服务器返回304时直接使用本地副本，重复检查只需一次很小的往返。
+    只缓存AIP.JSON和列表等非流式请求；航图PDF和流式请求直接透传，由下载器自行落盘和续传。
+    索引保存在SQLite中，总大小超过上限时按最近访问时间淘汰。
+    """
+
+    # 命中缓存时返回的响应头
+    KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        # 下载线程共享同一个连接，所有访问都在lock内进行
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                file TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.conn.commit()
+        self.total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+    @classmethod
+    def from_config(cls, login):
+        """按config.ini [http_cache] 创建，未启用时返回None"""
+        config = login.config
+        if not config.getboolean('http_cache', 'enabled', fallback=True):
+            return None
+        cache_dir = login.resolve_path(config.get('http_cache', 'cache_dir', fallback='http_cache'))
+        max_mb = config.getfloat('http_cache', 'max_mb', fallback=512)
+        return cls(cache_dir, int(max_mb * 1024 * 1024))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @staticmethod
+    def key_of(url):
+        """缓存键：eaip根路径下的相对路径（Windows反斜杠统一为正斜杠）"""
+        parsed = urlparse(url.replace('\\', '/').replace('%5C', '/').replace('%5c', '/'))
+        path = parsed.path
+        if '/eaip/' in path:
+            path = path.split('/eaip/', 1)[1]
+        key = path.lstrip('/')
+        return f"{key}?{parsed.query}" if parsed.query else key
+
+    def _file_path(self, name):
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def _count(self, key):
+        self.stats[key] += 1
+        metrics.inc('eaip_http_cache_total', result=key)
+
+    def lookup(self, key):
+        """返回缓存项（字典），没有时返回None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT file, etag, last_modified, headers, size FROM entries WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {'key': key, 'file': row[0], 'etag': row[1], 'last_modified': row[2],
+                'headers': json.loads(row[3] or '{}'), 'size': row[4]}
+
+    def read(self, entry):
+        """读取缓存内容并更新访问时间，文件缺失或不完整时删除该项并返回None"""
+        try:
+            with open(self._file_path(entry['file']), 'rb') as f:
+                body = f.read()
+        except OSError:
+            body = None
+        with self.lock:
+            if body is None or len(body) != entry['size']:
+                self._delete(entry['key'])
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE entries SET accessed=? WHERE key=?", (time.time(), entry['key']))
+            self.conn.commit()
+            self._count('hits')
+        return body
+
+    def store(self, key, response, body):
+        """保存200响应，响应没有ETag和Last-Modified（无法验证）或超过缓存上限时不保存"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified) or len(body) > self.max_bytes:
+            return False
+        headers = {name: response.headers[name] for name in self.KEPT_HEADERS if name in response.headers}
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        path = self._file_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        with self.lock:
+            os.replace(tmp_path, path)
+            old = self.conn.execute("SELECT size FROM entries WHERE key=?", (key,)).fetchone()
+            self.total += len(body) - (old[0] if old else 0)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, file, etag, last_modified, headers, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, name, etag, last_modified, json.dumps(headers), len(body), time.time()))
+            self._count('stored')
+            self._evict()
+            self.conn.commit()
+        return True
+
+    def _delete(self, key):
+        row = self.conn.execute("SELECT file, size FROM entries WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+        self.total -= row[1]
+        try:
+            os.remove(self._file_path(row[0]))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小不超过上限（调用方持有lock）"""
+        if self.total <= self.max_bytes:
+            return
+        for key, _ in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if self.total <= self.max_bytes:
+                break
+            self._delete(key)
+            self._count('evicted')
+
+    def adapter(self, **kwargs):
+        """返回挂载到requests会话上的传输适配器"""
+        return CachingAdapter(self, **kwargs)
+
+
+class CachingAdapter(HTTPAdapter):
+    """带条件请求缓存的HTTPAdapter
+
+    只处理不带Range、非流式（stream=False）且不是PDF的GET请求：有缓存时附加验证头，
+    服务器返回304时用缓存内容构造200响应（响应头X-Cache: HIT），返回200且带验证信息时保存响应体。
+    """
+
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def cacheable(request, stream=False):
+        """流式请求和航图PDF不经过缓存：读取完整响应体会破坏分块写入和断点续传，
+        且已下载的航图不会再次请求，缓存只会重复占用磁盘"""
+        if request.method != 'GET' or stream or 'Range' in request.headers:
+            return False
+        return not urlparse(request.url).path.lower().endswith('.pdf')
+
+    def send(self, request, **kwargs):
+        if not self.cacheable(request, kwargs.get('stream', False)):
+            return super().send(request, **kwargs)
+
+        key = self.cache.key_of(request.url)
+        entry = self.cache.lookup(key)
+        if entry is not None:
+            conditional = request.copy()
+            if entry['etag']:
+                conditional.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                conditional.headers['If-Modified-Since'] = entry['last_modified']
+            response = super().send(conditional, **kwargs)
+            if response.status_code == 304:
+                body = self.cache.read(entry)
+                if body is not None:
+                    response.close()
+                    return self._cached_response(request, entry, body)
+                # 缓存文件已丢失，重新发送不带验证头的请求
+                response.close()
+                response = super().send(request, **kwargs)
+        else:
+            response = super().send(request, **kwargs)
+
+        if response.status_code == 200:
+            with self.cache.lock:
+                self.cache._count('misses')
+            if response.headers.get('ETag') or response.headers.get('Last-Modified'):
+                self.cache.store(key, response, response.content)
+        return response
+
+    def _cached_response(self, request, entry, body):
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.headers['Content-Length'] = str(len(body))
+        response.headers['X-Cache'] = 'HIT'
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.exceptions import ConnectionError, Timeout
+from instrumentation import metrics
+
+# 可重试的HTTP状态码；其中5xx同时计入熔断器
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_EXCEPTIONS = (ConnectionError, Timeout)
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """指数退避加全抖动：在 [0, min(max_delay, base_delay * 2^attempt)] 内随机取值"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """解析Retry-After头（秒数或HTTP日期），无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """线程安全的令牌桶限速器，所有下载线程共享同一个实例"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取出一个令牌，令牌不足时等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后暂停所有请求，冷却后放行一个探测请求"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.condition = threading.Condition()
+
+    def before_request(self):
+        """熔断打开时阻塞等待，直到冷却结束并轮到本线程"""
+        with self.condition:
+            while True:
+                if self.state == self.CLOSED:
+                    return
+                if self.state == self.OPEN:
+                    remaining = self.opened_at + self.cooldown - time.monotonic()
+                    if remaining > 0:
+                        self.condition.wait(remaining)
+                        continue
+                    self.state = self.HALF_OPEN
+                    self.probing = False
+                if not self.probing:
+                    self.probing = True
+                    return
+                self.condition.wait()
+
+    def record_success(self):
+        with self.condition:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                print("上游已恢复，熔断器关闭")
+            self.state = self.CLOSED
+            self.probing = False
+            self.condition.notify_all()
+
+    def release(self):
+        """结果不计入成败（如429或本地错误）时释放探测名额"""
+        with self.condition:
+            self.probing = False
+            self.condition.notify_all()
+
+    def record_failure(self):
+        with self.condition:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"连续失败{self.failures}次，暂停所有请求{self.cooldown:.0f}秒")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+                self.condition.notify_all()
+
+
+class HttpPolicy:
+    """所有EaipLogin请求共享的重试/限速/熔断策略"""
+
+    def __init__(self, max_retries=4, base_delay=1.0, max_delay=30.0,
+                 rate=10.0, burst=20, failure_threshold=5, cooldown=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+
+    @classmethod
+    def from_config(cls, config):
+        section = 'http'
+        return cls(
+            max_retries=config.getint(section, 'max_retries', fallback=4),
+            base_delay=config.getfloat(section, 'base_delay', fallback=1.0),
+            max_delay=config.getfloat(section, 'max_delay', fallback=30.0),
+            rate=config.getfloat(section, 'rate', fallback=10.0),
+            burst=config.getint(section, 'burst', fallback=20),
+            failure_threshold=config.getint(section, 'failure_threshold', fallback=5),
+            cooldown=config.getfloat(section, 'cooldown', fallback=30.0),
+        )
+
+    def backoff(self, attempt, retry_after=None):
+        """计算第attempt次重试前的等待时间，服务器给出Retry-After时以其为准"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay * 4)
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    def request(self, session, method, url, **kwargs):
+        """发送请求；连接错误、超时和可重试状态码按策略重试
+
+        重试用尽后返回最后一次响应（由调用方检查状态码），或抛出最后一次异常。
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except RETRY_EXCEPTIONS as e:
+                metrics.record_request(url, None, time.perf_counter() - start, retry=attempt > 0)
+                self.breaker.record_failure()
+                attempt += 1
+                if attempt > self.max_retries:
+                    print(f"请求失败，已重试{self.max_retries}次: {str(e)}")
+                    raise
+                delay = self.backoff(attempt - 1)
+                print(f"请求失败，{delay:.1f}秒后进行第{attempt}次重试...")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # 其他请求异常（如URL错误）重试也无济于事
+                self.breaker.release()
+                raise
+
+            # 流式响应的正文由调用方读取，这里只能按Content-Length统计
+            if kwargs.get('stream'):
+                length = response.headers.get('Content-Length')
+                size = int(length) if length and length.isdigit() else 0
+            else:
+                size = len(response.content)
+            metrics.record_request(url, response.status_code, time.perf_counter() - start, size, retry=attempt > 0)
+
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            attempt += 1
+            if attempt > self.max_retries:
+                print(f"请求失败，已重试{self.max_retries}次，状态码: {response.status_code}")
+                return response
+            delay = self.backoff(attempt - 1, parse_retry_after(response.headers.get('Retry-After')))
+            response.close()
+            print(f"服务器返回{response.status_code}，{delay:.1f}秒后进行第{attempt}次重试...")
+            time.sleep(delay)
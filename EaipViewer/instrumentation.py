@@ -0,0 +1,165 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlparse
+
+# 延迟直方图的桶边界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+ENDPOINTS = (
+    ('/login/captcha', 'login/captcha'),
+    ('/login/login', 'login/login'),
+    ('/package/listPage', 'package/listPage'),
+    ('/publication/listByLoginPage', 'publication/listByLoginPage'),
+    ('/user/validSuperAdmin', 'user/validSuperAdmin'),
+    ('/JsonPath/AIP.JSON', 'AIP.JSON'),
+)
+
+
+def endpoint_of(url):
+    """将请求URL归类为接口名称，作为指标标签"""
+    path = urlparse(url).path.replace('%5C', '/').replace('\\', '/')
+    for suffix, name in ENDPOINTS:
+        if path.endswith(suffix):
+            return name
+    if path.lower().endswith('.pdf'):
+        return 'pdf'
+    return 'other'
+
+
+class Metrics:
+    """线程安全的指标收集器：计数器、延迟直方图、阶段计时和可选的cProfile"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}    # (名称, 标签) -> 数值
+        self.histograms = {}  # (名称, 标签) -> [各桶计数, 总和, 次数]
+        self.profile_dir = None
+        self._local = threading.local()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        """记录一个阶段的耗时；设置了profile_dir时同时用cProfile采样（不支持嵌套）"""
+        profiler = None
+        if self.profile_dir and not getattr(self._local, 'profiling', False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self._local.profiling = True
+            except ValueError:  # 已有其他分析器在运行
+                profiler = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('eaip_stage_seconds', time.perf_counter() - start, stage=stage)
+            if profiler is not None:
+                profiler.disable()
+                self._local.profiling = False
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{stage}.prof"))
+
+    def timed(self, stage):
+        """以装饰器形式记录函数耗时"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record_request(self, url, status, elapsed, size=0, retry=False):
+        """记录一次HTTP请求（status为None表示连接失败或超时）"""
+        endpoint = endpoint_of(url)
+        self.inc('eaip_http_requests_total', endpoint=endpoint, status=str(status or 'error'))
+        self.observe('eaip_http_request_seconds', elapsed, endpoint=endpoint)
+        if size:
+            self.inc('eaip_http_bytes_total', size, endpoint=endpoint)
+        if retry:
+            self.inc('eaip_http_retries_total', endpoint=endpoint)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), 'buckets': dict(zip(self.buckets, counts)),
+                     'sum': total, 'count': count}
+                    for (name, labels), (counts, total, count) in sorted(self.histograms.items())
+                ],
+            }
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+    def to_prometheus(self):
+        """导出为Prometheus文本格式"""
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{self._format_labels(labels)} {value}")
+            for (name, labels), (counts, total, count) in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', bound),))} {bucket_count}")
+                lines.append(f"{name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        """按扩展名导出：.prom/.txt为Prometheus文本，其余为JSON"""
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+# 进程内共享的指标实例
+metrics = Metrics()
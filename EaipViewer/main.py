@@ -1,32 +1,176 @@
 from eaip_login import EaipLogin
 from aip_filter import AipFilter
+from package_catalog import PackageCatalog
+from filter_rules import FilterRules
+from chart_downloader import ChartDownloader
+from chart_search import ChartSearch
+from chart_manifest import ChartManifest
+from chart_processor import ChartProcessor
+from chart_pack import ChartPack
+from airac_sync import AiracSync
+from prefetch_scheduler import PrefetchScheduler
+from aip_diff import AipDiff
+from aip_view import AipView
+from mirror_server import MirrorServer
+from package_watcher import PackageWatcher
+from instrumentation import metrics
+import argparse
+import asyncio
+import os
 import sys
 import traceback
 import time
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="中国民航eAIP目录获取工具")
+    parser.add_argument('--download', action='store_true', help="过滤完成后并发下载航图")
+    parser.add_argument('--sync', action='store_true', help="增量同步：只下载新增或修改的航图，复用本地未变化文件")
+    parser.add_argument('--stream', action='store_true', help="流式解析AIP.JSON，边下载边过滤")
+    parser.add_argument('--search', default=None, metavar='QUERY', help="检索航图，例如 \"ZSPD ILS RWY35L\" 或 \"区域图 上海\"")
+    parser.add_argument('--diff', default=None, metavar='DATANAME', help="与指定版本（如 EAIP2025-02.V1.5）对比，下载/同步时只处理新增和重新发布的航图")
+    parser.add_argument('--mirror', action='store_true', help="以当前会话启动局域网缓存镜像服务器")
+    parser.add_argument('--watch', action='store_true', help="常驻监视package列表，提前同步新版本并在生效时切换当前版本")
+    parser.add_argument('--metrics', default=None, metavar='PATH', help="运行结束后导出指标（.prom为Prometheus文本格式，其余为JSON）")
+    parser.add_argument('--profile', default=None, metavar='DIR', help="对各阶段进行cProfile采样并保存到该目录")
+    parser.add_argument('--process', action='store_true', help="下载的同时用进程池校验航图、提取页数并生成缩略图")
+    parser.add_argument('--prefetch', action='store_true', help="按优先级下载：先下载config.ini中的重点机场，其余航图在后台补齐")
+    parser.add_argument('--export-pack', default=None, metavar='PATH', help="下载完成后将当前版本的航图写入单文件航图包")
+    parser.add_argument('--async', dest='use_async', action='store_true', help="使用asyncio客户端下载航图（单线程高并发）")
+    parser.add_argument('--view', default=None, metavar='QUERY', help="只显示指定机场或章节的子树，例如 \"ZBAA\" 或 \"ENR 6,AD 2\"")
+    parser.add_argument('--modified-only', action='store_true', help="只显示包含修改项的分支")
+    parser.add_argument('--depth', type=int, default=None, help="显示的最大层级（更深的节点折叠为数量）")
+    parser.add_argument('--format', dest='view_format', choices=('text', 'tree', 'json'), default='text',
+                        help="目录显示格式")
+    parser.add_argument('--workers', type=int, default=None, help="下载线程数（默认读取config.ini）")
+    parser.add_argument('--output', default=None, help="航图下载目录（默认读取config.ini）")
+    return parser.parse_args()
+
+def compare_packages(catalog, data_name, current_package, aip_structure, rules, output_path):
+    """将当前版本与指定版本对比，打印各机场汇总并保存变化集"""
+    old_package = catalog.find_by_name(data_name)
+    if not old_package:
+        print(f"未找到版本 {data_name}，跳过对比")
+        return None
+    print(f"\n对比 {data_name} -> {current_package.get('dataName', 'unknown')}...")
+    old_structure = catalog.load_tree(old_package, rules)
+    if not old_structure:
+        print(f"获取 {data_name} 目录失败，跳过对比")
+        return None
+    diff = AipDiff(old_structure, aip_structure, old_package, current_package)
+    diff.compare()
+    diff.print_summary()
+    diff.save(output_path)
+    print(f"变化集已保存到 {output_path}")
+    return diff
+
+async def download_async(login, tasks, output_dir=None, workers=None, manifest=None, processor=None):
+    """用异步客户端下载航图，共享当前会话的token和Cookie"""
+    # aiohttp只在--async时需要，未安装时不影响默认的同步下载
+    from async_client import AsyncEaipClient
+    async with AsyncEaipClient(login, concurrency=workers, output_dir=output_dir, manifest=manifest) as client:
+        client.downloader.processor = processor
+        return await client.download_all(tasks)
+
+def run_mirror(login):
+    """运行缓存镜像服务器直到按下Ctrl+C"""
+    server = MirrorServer.from_config(login)
+    print(f"镜像服务器已启动: {server.base_url}，缓存目录: {server.cache_dir}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    print(f"缓存统计: {server.stats}")
+
 def main():
+    args = parse_args()
+    metrics.profile_dir = args.profile
     try:
         login = EaipLogin()
-        if login.login():
+        if login.ensure_login():
+            if args.mirror:
+                run_mirror(login)
+                return
+            if args.watch:
+                PackageWatcher.from_config(login, output_dir=args.output).run()
+                return
+            catalog = PackageCatalog(login)
+            manifest = ChartManifest.from_config(login)
             for attempt in range(3):  # 最多尝试3次
                 print("\n开始获取AIP目录结构...")
-                aip_structure = login.get_current_aip_structure()
+                rules = FilterRules.from_config(login.config)
+                current_package, aip_structure = catalog.resolve(
+                    rules, stream=args.stream, refresh=attempt > 0, manifest=manifest)
+                streamed = catalog.streamed
                 if aip_structure:
                     print("\n开始过滤目录内容...")
-                    # 获取当前package信息
-                    current_package = None
-                    packages = login.get_package_list()
-                    if packages and packages.get("data"):
-                        package_list = packages["data"].get("data", [])
-                        for pkg in package_list:
-                            if pkg.get("dataStatus") == "CURRENTLY_ISSUE":
-                                current_package = pkg
-                                break
-                    
-                    # 传递package_info给filter_content
-                    filtered_content = AipFilter.filter_content(aip_structure, current_package)
-                    print("\n显示过滤后的目录结构:")
-                    AipFilter.print_structure(filtered_content)
+                    if streamed:
+                        # 流式模式下已边下载边过滤（pdf_paths.txt和清单已写好），直接使用命中结果
+                        filtered_content = [{'name_cn': name, 'Is_Modified': item.get('Is_Modified', 'N'),
+                                             'children': []} for name, _, item in catalog.stream_results]
+                    else:
+                        # 传递package_info给filter_content
+                        filtered_content = AipFilter.filter_content(
+                            aip_structure, current_package, rules, manifest=manifest)
+                    if args.view or args.modified_only or args.depth is not None or args.view_format != 'text':
+                        print("\n显示目录结构:")
+                        print(AipView(aip_structure).render(args.view, args.depth, args.modified_only,
+                                                            args.view_format))
+                    else:
+                        print("\n显示过滤后的目录结构:")
+                        AipFilter.print_structure(filtered_content)
+
+                    if args.search:
+                        # 只在检索时增量更新检索索引
+                        search = ChartSearch.from_config(login)
+                        try:
+                            search.update(aip_structure, current_package)
+                            results = search.search(args.search)
+                            print(f"\n检索 \"{args.search}\" 共找到 {len(results)} 个结果:")
+                            for item in results:
+                                print(f"- {item['name_cn']}: {item['url']}")
+                        finally:
+                            search.close()
+
+                    diff = None
+                    if args.diff:
+                        diff = compare_packages(catalog, args.diff, current_package, aip_structure,
+                                                rules, os.path.join(login.base_dir, 'changeset.json'))
+
+                    if args.download or args.sync:
+                        downloader = ChartDownloader(login, output_dir=args.output, workers=args.workers,
+                                                     manifest=manifest, mount=args.workers is not None)
+                        processor = None
+                        if args.process:
+                            processor = ChartProcessor.from_config(login, manifest, downloader.output_dir)
+                            downloader.processor = processor
+                            processor.process_existing(downloader, current_package)
+                        tasks = list(manifest.tasks(current_package))
+                        if diff is not None:
+                            changed = {url for _, url, _ in diff.download_tasks()}
+                            tasks = [(name, url) for name, url in tasks if url in changed]
+                        download_func = None
+                        if args.prefetch:
+                            scheduler = PrefetchScheduler.from_config(login, downloader)
+                            download_func = lambda items: scheduler.run(items, current_package)
+                        if args.sync:
+                            print("\n开始增量同步航图...")
+                            urls = {url for _, url in tasks}
+                            charts = AiracSync.charts_from_aip(aip_structure, current_package, urls)
+                            AiracSync(downloader).sync(charts, download_func)
+                        elif args.use_async:
+                            print("\n开始异步下载航图...")
+                            asyncio.run(download_async(login, tasks, downloader.output_dir, args.workers, manifest, processor))
+                        elif download_func is not None:
+                            print("\n开始按优先级预取航图...")
+                            download_func(tasks)
+                        else:
+                            print("\n开始下载航图...")
+                            downloader.download_all(tasks)
+                        if processor is not None:
+                            processor.finish()
+                        if args.export_pack:
+                            print("\n开始生成航图包...")
+                            ChartPack.build(args.export_pack, manifest, current_package, downloader)
                     break
                 else:
                     if attempt < 2:
@@ -40,6 +184,10 @@ def main():
         print(f"\n程序发生错误: {str(e)}")
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if args.metrics:
+            metrics.export(args.metrics)
+            print(f"指标已导出到 {args.metrics}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+from chart_downloader import ChartDownloader
+from chart_pack import ChartPack
+from file_utils import blank_jpeg, write_json
+from instrumentation import metrics
+
+
+class MirrorServer:
+    """局域网共享的eAIP缓存镜像
+
+    使用一个已登录的EaipLogin会话访问上游，向局域网内的客户端提供 package/listPage、
+    publication/listByLoginPage、AIP.JSON 和航图PDF。文件按上游相对路径缓存在磁盘上，
+    响应带ETag/Last-Modified并支持条件请求和Range；多个客户端同时请求同一个未缓存文件时
+    只向上游发起一次请求。package下的文件内容不会变化，只下载一次；列表接口按TTL刷新。
+
+    配置了航图包（chart_pack.py）时，包内的航图直接从mmap映射区切片发送，不再逐个打开文件。
+
+    客户端把config.ini中[server] base_url指向 http://镜像地址:端口/eaip 即可，
+    登录接口由镜像直接应答（验证码任意填写），因此只应在可信的局域网内使用。
+    """
+
+    LIST_ENDPOINTS = {
+        '/package/listPage': 'package/listPage.json',
+        '/publication/listByLoginPage': 'publication/listByLoginPage.json',
+    }
+
+    def __init__(self, login, cache_dir=None, host='0.0.0.0', port=8081, list_ttl=300, pack=None):
+        self.login = login
+        # 服务线程没有终端，上游会话过期时不能等待验证码输入，直接返回502或旧数据
+        login.interactive = False
+        self.cache_dir = login.resolve_path(cache_dir or 'mirror')
+        self.list_ttl = list_ttl
+        self.pack = pack  # ChartPack
+        self.downloader = ChartDownloader(login, output_dir=cache_dir)
+        self.inflight = {}  # 相对路径 -> 正在进行的上游请求
+        self.inflight_lock = threading.Lock()
+        self.stats = {'hits': 0, 'pack_hits': 0, 'misses': 0, 'coalesced': 0, 'upstream_errors': 0}
+        self.stats_lock = threading.Lock()
+        self.captcha = blank_jpeg()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @classmethod
+    def from_config(cls, login, host=None, port=None):
+        config = login.config
+        pack = None
+        pack_path = login.resolve_path(config.get('mirror', 'pack', fallback=''))
+        if pack_path:
+            if os.path.exists(pack_path):
+                pack = ChartPack(pack_path)
+            else:
+                print(f"航图包不存在，忽略: {pack_path}")
+        return cls(
+            login,
+            cache_dir=config.get('mirror', 'cache_dir', fallback='mirror'),
+            host=host or config.get('mirror', 'host', fallback='0.0.0.0'),
+            port=port if port is not None else config.getint('mirror', 'port', fallback=8081),
+            list_ttl=config.getfloat('mirror', 'list_ttl_seconds', fallback=300),
+            pack=pack,
+        )
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        if host == '0.0.0.0':
+            host = '127.0.0.1'
+        return f"http://{host}:{port}/eaip"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.pack is not None:
+            self.pack.close()
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+        metrics.inc('eaip_mirror_requests_total', result=key)
+
+    @staticmethod
+    def relpath(request_path):
+        """将请求路径转为缓存相对路径，拒绝越出缓存目录的路径"""
+        path = unquote(urlparse(request_path).path).replace('\\', '/')
+        if path.startswith('/eaip/'):
+            path = path[len('/eaip/'):]
+        parts = [part for part in path.split('/') if part]
+        if not parts or any(part in ('.', '..') for part in parts):
+            return None
+        return '/'.join(parts)
+
+    def cache_path(self, relpath):
+        return os.path.join(self.cache_dir, *relpath.split('/'))
+
+    def _is_fresh(self, path, ttl):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        return ttl is None or time.time() - mtime < ttl
+
+    def ensure_cached(self, relpath, fetch, ttl=None):
+        """保证文件已缓存；同一文件的并发请求只有一个会访问上游，其余等待其结果
+
+        返回本地路径，上游失败时返回None。
+        """
+        path = self.cache_path(relpath)
+        if self._is_fresh(path, ttl):
+            self._count('hits')
+            return path
+
+        with self.inflight_lock:
+            event = self.inflight.get(relpath)
+            leader = event is None
+            if leader:
+                event = self.inflight[relpath] = threading.Event()
+        if not leader:
+            self._count('coalesced')
+            event.wait()
+            return path if os.path.exists(path) else None
+
+        self._count('misses')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fetch(relpath, path)
+            return path
+        except Exception as e:
+            self._count('upstream_errors')
+            print(f"上游获取失败 {relpath}: {str(e)}")
+            # 列表接口刷新失败时继续提供旧数据
+            return path if os.path.exists(path) else None
+        finally:
+            with self.inflight_lock:
+                del self.inflight[relpath]
+            event.set()
+
+    def _fetch_file(self, relpath, path):
+        self.downloader._fetch_to_file(relpath, path)
+
+    def _fetch_package_list(self, relpath, path):
+        data = self.login.get_package_list()
+        if not self.login._has_package_data(data):
+            raise ValueError("上游未返回package列表")
+        write_json(path, data)
+
+    def _fetch_publication_list(self, relpath, path):
+        data = self.login.get_publication_list()
+        if data is None:
+            raise ValueError("上游未返回资料列表")
+        write_json(path, data)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b'', content_type='application/json', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != 'HEAD' and body:
+                    self.wfile.write(body)
+
+            def _send_json(self, data):
+                self._send(200, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+            def _not_modified(self, etag, mtime):
+                if_none_match = self.headers.get('If-None-Match')
+                if if_none_match:
+                    return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+                if_modified_since = self.headers.get('If-Modified-Since')
+                if if_modified_since:
+                    try:
+                        return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+                    except (TypeError, ValueError):
+                        return False
+                return False
+
+            def _send_file(self, path, content_type):
+                stat = os.stat(path)
+                etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+                with open(path, 'rb') as f:
+                    self._send_content(f, stat.st_size, etag, stat.st_mtime, content_type)
+
+            def _send_content(self, source, size, etag, mtime, content_type):
+                """发送文件或内存切片，处理条件请求和Range；source为文件对象或memoryview"""
+                headers = {
+                    'ETag': etag,
+                    'Last-Modified': formatdate(mtime, usegmt=True),
+                    'Accept-Ranges': 'bytes',
+                }
+                if self._not_modified(etag, mtime):
+                    self.send_response(304)
+                    for key, value in headers.items():
+                        self.send_header(key, value)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                start = 0
+                byte_range = self.headers.get('Range')
+                if_range = self.headers.get('If-Range')
+                if byte_range and byte_range.startswith('bytes=') and (not if_range or if_range == etag):
+                    start_text = byte_range[6:].split('-')[0]
+                    start = int(start_text) if start_text.isdigit() else 0
+                    if start >= size:
+                        self._send(416, b'', content_type, {'Content-Range': f"bytes */{size}"})
+                        return
+                if isinstance(source, memoryview):
+                    body = source[start:]
+                else:
+                    source.seek(start)
+                    body = source.read()
+                if start:
+                    headers['Content-Range'] = f"bytes {start}-{size - 1}/{size}"
+                    self._send(206, body, content_type, headers)
+                else:
+                    self._send(200, body, content_type, headers)
+
+            def _send_packed(self, relpath):
+                """从航图包发送，包内没有该文件时返回False"""
+                entry = server.pack.entry(relpath) if server.pack is not None else None
+                if entry is None:
+                    return False
+                server._count('pack_hits')
+                data = server.pack.get(relpath)
+                try:
+                    self._send_content(data, entry[2], f'"{entry[3][:32]}"', server.pack.created,
+                                       'application/pdf')
+                finally:
+                    data.release()
+                return True
+
+            def _drain(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def do_POST(self):
+                self._drain()
+                path = urlparse(self.path).path
+                if path.endswith('/login/login'):
+                    self._send_json({'retCode': 200, 'data': {'token': uuid.uuid4().hex,
+                                                              'eaipUserUuid': uuid.uuid4().hex}})
+                    return
+                if path.endswith('/user/validSuperAdmin'):
+                    self._send_json({'retCode': 200, 'data': False})
+                    return
+                for suffix, relpath in server.LIST_ENDPOINTS.items():
+                    if path.endswith(suffix):
+                        fetch = (server._fetch_package_list if suffix == '/package/listPage'
+                                 else server._fetch_publication_list)
+                        cached = server.ensure_cached(relpath, fetch, server.list_ttl)
+                        if cached:
+                            self._send_file(cached, 'application/json')
+                        else:
+                            self._send(502)
+                        return
+                self._send(404)
+
+            def do_GET(self):
+                if urlparse(self.path).path.endswith('/login/captcha'):
+                    self._send(200, server.captcha, 'image/jpeg')
+                    return
+                relpath = server.relpath(self.path)
+                if not relpath or not relpath.lower().endswith(('.pdf', '.json')):
+                    self._send(404)
+                    return
+                if self._send_packed(relpath):
+                    return
+                cached = server.ensure_cached(relpath, server._fetch_file)
+                if not cached:
+                    self._send(502)
+                    return
+                content_type = 'application/pdf' if relpath.lower().endswith('.pdf') else 'application/json'
+                self._send_file(cached, content_type)
+
+            do_HEAD = do_GET
+
+        return Handler
+
+
+def main():
+    from eaip_login import EaipLogin
+
+    parser = argparse.ArgumentParser(description="局域网共享的eAIP缓存镜像服务器")
+    parser.add_argument('--host', default=None, help="监听地址（默认读取config.ini）")
+    parser.add_argument('--port', type=int, default=None, help="监听端口（默认读取config.ini）")
+    args = parser.parse_args()
+
+    login = EaipLogin()
+    if not login.ensure_login():
+        print("登录失败，无法启动镜像服务器")
+        return
+    server = MirrorServer.from_config(login, args.host, args.port)
+    print(f"镜像服务器已启动: {server.base_url}，缓存目录: {server.cache_dir}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    print(f"缓存统计: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+from file_utils import blank_jpeg
+
+
+class MockEaipServer:
+    """离线基准测试用的本地eAIP模拟服务器
+
+    实现 login/captcha、login/login、package/listPage、publication/listByLoginPage、
+    user/validSuperAdmin、JsonPath/AIP.JSON 和PDF下载接口。AIP.JSON取自本目录的样本文件，
+    可按倍数放大；每个请求可配置延迟和随机错误率，PDF内容按文件名确定性生成并支持Range。
+    AIP.JSON和PDF带ETag，请求带If-None-Match且匹配时返回304。
+    """
+
+    DATA_NAME = "EAIP2025-02.V1.5"
+    FILE_PATH = "packageFile\\BASELINE\\2025-02\\EAIP2025-02.V1.5"
+
+    def __init__(self, host='127.0.0.1', port=0, aip_json_path=None, latency=0.0,
+                 error_rate=0.0, scale=1, pdf_size=200 * 1024, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pdf_size = pdf_size
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.tokens = set()
+        self.stats = {'requests': 0, 'errors': 0, 'bytes': 0, 'not_modified': 0}
+        self.stats_lock = threading.Lock()
+
+        if aip_json_path is None:
+            aip_json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AIP.JSON')
+        with open(aip_json_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        self.aip_json = json.dumps(self.scale_records(records, scale), ensure_ascii=False).encode('utf-8')
+        self.aip_json_etag = '"' + hashlib.md5(self.aip_json).hexdigest() + '"'
+        # package/listPage返回的列表，可在测试中追加新版本或修改dataStatus
+        self.packages = [self.package_info]
+        self.captcha = blank_jpeg()
+        self.preview = blank_jpeg()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @staticmethod
+    def scale_records(records, scale):
+        """将样本目录复制scale份（id加后缀）以模拟更大的package"""
+        if scale <= 1:
+            return records
+        scaled = list(records)
+        for copy in range(1, int(scale)):
+            suffix = f"-{copy}"
+            for item in records:
+                clone = dict(item)
+                clone['id'] = item['id'] + suffix
+                if item.get('pId'):
+                    clone['pId'] = item['pId'] + suffix
+                if item.get('pdfPath'):
+                    head, _, tail = item['pdfPath'].rpartition('/')
+                    clone['pdfPath'] = f"{head}/{copy}{tail}"
+                scaled.append(clone)
+        return scaled
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/eaip"
+
+    @property
+    def package_info(self):
+        return {
+            'dataName': self.DATA_NAME,
+            'filePath': self.FILE_PATH,
+            'dataStatus': 'CURRENTLY_ISSUE',
+            'effectiveTime': '2025-02-20 00:00:00',
+        }
+
+    def pdf_body(self, name):
+        """按文件名确定性生成PDF内容（含一页的页树和一张内嵌JPEG，便于下载后处理）"""
+        seed = hashlib.md5(name.encode('utf-8')).digest()
+        header = (b'%PDF-1.4\n'
+                  b'1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+                  b'2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n'
+                  b'3 0 obj << /Type /Page /Parent 2 0 R /Resources << /XObject << /Im0 4 0 R >> >> >> endobj\n'
+                  b'4 0 obj << /Type /XObject /Subtype /Image /Filter /DCTDecode /Length '
+                  + str(len(self.preview)).encode('ascii') + b' >>\nstream\n' + self.preview + b'\nendstream\nendobj\n'
+                  b'5 0 obj << /Title (' + name.encode('ascii', 'replace') + b') /Producer (mock) >> endobj\n')
+        trailer = b'\n%%EOF\n'
+        filler_size = max(0, self.pdf_size - len(header) - len(trailer))
+        filler = (seed * (filler_size // len(seed) + 1))[:filler_size]
+        return header + filler + trailer
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _should_fail(self):
+        with self.random_lock:
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b'', content_type='application/json', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+                with server.stats_lock:
+                    server.stats['bytes'] += len(body)
+
+            def _send_json(self, data):
+                self._send(200, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+            def _authorized(self):
+                return self.headers.get('token') in server.tokens
+
+            def _prepare(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with server.stats_lock:
+                    server.stats['requests'] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._should_fail():
+                    with server.stats_lock:
+                        server.stats['errors'] += 1
+                    self._send(503, b'', headers={'Retry-After': '0'})
+                    return None
+                return body
+
+            def do_POST(self):
+                body = self._prepare()
+                if body is None:
+                    return
+                path = urlparse(self.path).path
+                if path.endswith('/login/login'):
+                    token = uuid.uuid4().hex
+                    server.tokens.add(token)
+                    self._send_json({'retCode': 200, 'data': {'token': token, 'eaipUserUuid': uuid.uuid4().hex}})
+                elif not self._authorized():
+                    self._send_json({'retCode': 0, 'retMsg': 'login has expired'})
+                elif path.endswith('/package/listPage'):
+                    self._send_json({'retCode': 200, 'data': {'data': list(server.packages)}})
+                elif path.endswith('/publication/listByLoginPage'):
+                    self._send_json({'retCode': 200, 'data': []})
+                elif path.endswith('/user/validSuperAdmin'):
+                    self._send_json({'retCode': 200, 'data': False})
+                else:
+                    self._send(404)
+
+            def do_GET(self):
+                if self._prepare() is None:
+                    return
+                path = unquote(urlparse(self.path).path).replace('\\', '/')
+                if path.endswith('/login/captcha'):
+                    self._send(200, server.captcha, 'image/jpeg')
+                elif path.endswith('/JsonPath/AIP.JSON'):
+                    if not self._not_modified(server.aip_json_etag):
+                        self._send(200, server.aip_json, headers={'ETag': server.aip_json_etag})
+                elif path.lower().endswith('.pdf'):
+                    self._send_pdf(path.rsplit('/', 1)[-1])
+                else:
+                    self._send(404)
+
+            def _not_modified(self, etag):
+                """If-None-Match匹配时发送304并返回True"""
+                if_none_match = self.headers.get('If-None-Match')
+                if not if_none_match or etag not in [tag.strip() for tag in if_none_match.split(',')]:
+                    return False
+                with server.stats_lock:
+                    server.stats['not_modified'] += 1
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return True
+
+            def _send_pdf(self, name):
+                body = server.pdf_body(name)
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self._not_modified(etag):
+                    return
+                headers = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+                byte_range = self.headers.get('Range')
+                if_range = self.headers.get('If-Range')
+                if byte_range and byte_range.startswith('bytes=') and (not if_range or if_range == etag):
+                    start = int(byte_range[6:].split('-')[0] or 0)
+                    if start >= len(body):
+                        self._send(416, b'', 'application/pdf', {'Content-Range': f"bytes */{len(body)}"})
+                        return
+                    headers['Content-Range'] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                    self._send(206, body[start:], 'application/pdf', headers)
+                    return
+                self._send(200, body, 'application/pdf', headers)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地eAIP模拟服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="随机返回503的比例")
+    parser.add_argument('--scale', type=int, default=1, help="AIP目录放大倍数")
+    parser.add_argument('--pdf-size', type=int, default=200 * 1024, help="每个PDF的字节数")
+    args = parser.parse_args()
+
+    server = MockEaipServer(args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+                            scale=args.scale, pdf_size=args.pdf_size)
+    print(f"模拟服务器已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
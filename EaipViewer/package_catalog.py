@@ -0,0 +1,120 @@
+import time
+from requests.exceptions import RequestException
+from aip_filter import AipFilter
+from aip_index import AipIndex
+from aip_node import AipNode, compact_records
+from aip_snapshot import AipSnapshot
+from instrumentation import metrics
+
+
+class PackageCatalog:
+    """package列表与AIP目录的缓存层
+
+    listPage结果在TTL内只请求一次；resolve()一次性给出当前package信息和已建立索引的AIP目录，
+    目录优先取内存缓存，其次取本地快照，最后才下载AIP.JSON。
+    """
+
+    CURRENT_STATUS = "CURRENTLY_ISSUE"
+
+    def __init__(self, login, ttl=None, snapshot=None):
+        self.login = login
+        if ttl is None:
+            ttl = login.config.getfloat('catalog', 'ttl_seconds', fallback=300)
+        self.ttl = ttl
+        self.snapshot = snapshot if snapshot is not None else AipSnapshot.from_config(login)
+        self._packages = None
+        self._fetched_at = 0
+        self._trees = {}  # 快照键 -> AipIndex
+        self.streamed = False
+        self.stream_results = []  # 流式模式下命中规则的 (名称, URL, 记录)
+
+    def invalidate(self):
+        """清除package列表缓存"""
+        self._packages = None
+        self._fetched_at = 0
+
+    def list_packages(self, refresh=False):
+        """返回package列表，TTL内复用缓存"""
+        if not refresh and self._packages is not None and time.monotonic() - self._fetched_at < self.ttl:
+            return self._packages
+
+        data = self.login.get_package_list()
+        if not data or not isinstance(data.get("data"), dict):
+            print("获取包列表失败")
+            return self._packages or []
+        self._packages = data["data"].get("data") or []
+        self._fetched_at = time.monotonic()
+        return self._packages
+
+    def find(self, status, refresh=False):
+        """按dataStatus查找package"""
+        for pkg in self.list_packages(refresh):
+            if pkg.get("dataStatus") == status:
+                return pkg
+        return None
+
+    def find_by_name(self, data_name, refresh=False):
+        """按dataName（如 EAIP2025-02.V1.5）查找package"""
+        for pkg in self.list_packages(refresh):
+            if pkg.get("dataName") == data_name:
+                return pkg
+        return None
+
+    def current_package(self, refresh=False):
+        """当前生效的package"""
+        pkg = self.find(self.CURRENT_STATUS, refresh)
+        if not pkg:
+            print("未找到当前生效版本")
+        return pkg
+
+    def load_tree(self, package_info, rules=None, stream=False, manifest=None):
+        """获取指定package的AIP目录索引：内存缓存 -> 本地快照 -> 下载"""
+        self.streamed = False
+        self.stream_results = []
+        key = AipSnapshot.package_key(package_info)
+        tree = self._trees.get(key)
+        if tree is not None:
+            return tree
+
+        with metrics.timer('snapshot_load'):
+            nodes = self.snapshot.load(package_info)
+        if nodes:
+            print(f"已加载本地AIP快照，共{len(nodes)}个节点")
+            with metrics.timer('tree_build'):
+                tree = AipIndex(nodes)
+        elif stream:
+            # 边下载边过滤，pdf_paths.txt随记录到达增量写入，命中结果直接作为过滤结果
+            tree = AipIndex([])
+            records = (AipNode.from_dict(r) for r in self.login.iter_aip_json(package_info))
+            try:
+                with metrics.timer('aip_json_stream'):
+                    self.stream_results = list(AipFilter.stream_filter(records, package_info, rules, index=tree,
+                                                                       manifest=manifest))
+            except (RequestException, ValueError) as e:
+                # 与get_aip_json一致：返回None，由调用方重试
+                print(f"流式获取AIP.JSON失败: {str(e)}")
+                self.stream_results = []
+                return None
+            self.streamed = True
+            if not len(tree):
+                return None
+            self.snapshot.save(package_info, list(tree))
+        else:
+            json_data = self.login.get_aip_json(package_info)
+            if not json_data:
+                return None
+            with metrics.timer('tree_build'):
+                tree = AipIndex(compact_records(json_data))
+            with metrics.timer('snapshot_save'):
+                self.snapshot.save(package_info, list(tree))
+
+        self._trees[key] = tree
+        return tree
+
+    def resolve(self, rules=None, stream=False, refresh=False, manifest=None):
+        """一次性解析当前package，返回 (package信息, AIP目录索引)"""
+        package_info = self.current_package(refresh)
+        if not package_info:
+            return None, None
+        print(f"找到当前版本: {package_info.get('dataName', 'unknown')}")
+        return package_info, self.load_tree(package_info, rules, stream, manifest)
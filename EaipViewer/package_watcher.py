@@ -0,0 +1,361 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from aip_diff import AipDiff
+from aip_filter import AipFilter
+from airac_sync import AiracSync
+from chart_downloader import ChartDownloader, normalize_url
+from chart_manifest import ChartManifest
+from chart_pack import ChartPack
+from file_utils import load_json, write_json
+from filter_rules import FilterRules
+from instrumentation import metrics
+from package_catalog import PackageCatalog
+from prefetch_scheduler import PrefetchScheduler
+
+
+class PackageWatcher:
+    """常驻监视模式：定期轮询package列表，提前准备新版本，到生效时间后原子切换当前版本
+
+    发现新package或dataStatus变化（如 NEXT_ISSUE -> CURRENTLY_ISSUE）时，后台线程依次完成
+    目录下载与快照、过滤写入清单、与当前版本对比（changeset_<dataName>.json）和航图增量同步。
+    准备完成且到达effectiveTime（或服务器已将其标记为CURRENTLY_ISSUE）后，
+    用os.replace原子写入当前版本指针文件（current.json），此时所需数据均已在本地，切换是即时的。
+
+    轮询间隔在没有变化时逐渐加长到上限，失败时指数退避；临近生效时间时提前醒来。
+    已见过的状态和已准备的版本保存在状态文件中，重启后不会重复处理。
+    个别航图下载失败时版本仍记为已准备（附失败列表），之后空闲时只重试失败的航图，不会阻塞后续版本。
+    会话过期时只尝试恢复缓存会话，不会等待验证码输入。
+    """
+
+    CURRENT_STATUS = PackageCatalog.CURRENT_STATUS
+    EXPIRED_STATUS = "EXPIRED"
+    # 失败航图的最大重试轮数，超过后不再自动重试
+    MAX_RETRIES = 5
+    TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+    def __init__(self, login, pointer_path, state_path, interval=600, max_interval=3600,
+                 output_dir=None, prefetch=False, export_pack=False):
+        self.login = login
+        self.pointer_path = pointer_path
+        self.state_path = state_path
+        self.interval = interval
+        self.max_interval = max_interval
+        self.output_dir = output_dir
+        self.prefetch = prefetch
+        self.export_pack = export_pack
+        # 无人值守运行，会话过期时不能停在验证码输入上，失败后按退避间隔重试
+        login.interactive = False
+        self.catalog = PackageCatalog(login, ttl=0)
+        self.state = load_json(state_path) or {}
+        self.state.setdefault('statuses', {})
+        self.state.setdefault('prepared', {})
+        self.state.setdefault('attempts', {})  # dataName -> 准备失败次数
+        self.lock = threading.Lock()  # 保护state
+        self.worker = None
+        self.delay = interval
+        self.failures = 0
+
+    @classmethod
+    def from_config(cls, login, output_dir=None):
+        config = login.config
+        return cls(
+            login,
+            pointer_path=login.resolve_path(config.get('watch', 'pointer', fallback='current.json')),
+            state_path=login.resolve_path(config.get('watch', 'state_file', fallback='watch_state.json')),
+            interval=config.getfloat('watch', 'interval_seconds', fallback=600),
+            max_interval=config.getfloat('watch', 'max_interval_seconds', fallback=3600),
+            output_dir=output_dir,
+            prefetch=config.getboolean('watch', 'prefetch', fallback=False),
+            export_pack=config.getboolean('watch', 'export_pack', fallback=False),
+        )
+
+    def _save_state(self):
+        with self.lock:
+            write_json(self.state_path, self.state, indent=2)
+
+    @classmethod
+    def effective_time(cls, package_info):
+        """解析effectiveTime（无时区时按本地时间），返回时间戳，无法解析时返回None"""
+        value = str(package_info.get('effectiveTime') or '').strip()
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            pass
+        for fmt in cls.TIME_FORMATS:
+            try:
+                return datetime.strptime(value[:19], fmt).timestamp()
+            except ValueError:
+                continue
+        return None
+
+    def current_pointer(self):
+        """当前版本指针的内容，尚未切换过时返回None"""
+        return load_json(self.pointer_path)
+
+    def detect_changes(self, packages):
+        """与上次看到的状态对比，返回 [(dataName, 旧状态, 新状态)]，旧状态为None表示新版本"""
+        changes = []
+        with self.lock:
+            statuses = self.state['statuses']
+            for pkg in packages:
+                name, status = pkg.get('dataName'), pkg.get('dataStatus')
+                if not name:
+                    continue
+                if statuses.get(name) != status:
+                    changes.append((name, statuses.get(name), status))
+                    statuses[name] = status
+        for name, old, new in changes:
+            metrics.inc('eaip_watch_events_total', kind='new' if old is None else 'status')
+            if old is None:
+                print(f"发现新版本 {name}（{new}）")
+            else:
+                print(f"版本状态变化 {name}: {old} -> {new}")
+        return changes
+
+    def is_prepared(self, package_info):
+        with self.lock:
+            return package_info.get('dataName') in self.state['prepared']
+
+    def target_package(self, packages, now=None):
+        """应当作为当前版本的package：已到生效时间的版本中生效时间最晚的一个"""
+        now = time.time() if now is None else now
+        candidates = []
+        for pkg in packages:
+            effective = self.effective_time(pkg)
+            if pkg.get('dataStatus') == self.CURRENT_STATUS or \
+                    (pkg.get('dataStatus') != self.EXPIRED_STATUS and effective is not None and effective <= now):
+                candidates.append((effective or 0, pkg.get('dataStatus') == self.CURRENT_STATUS, pkg))
+        if not candidates:
+            return None
+        return max(candidates, key=lambda c: (c[0], c[1]))[2]
+
+    def pending_packages(self, packages):
+        """尚未准备的非过期版本：失败次数少的优先，其次当前版本优先，再按生效时间排序
+
+        准备失败（如目录获取失败）的版本排到其他版本之后，不会一直占用准备线程。
+        """
+        pending = [pkg for pkg in packages
+                   if pkg.get('dataName') and pkg.get('dataStatus') != self.EXPIRED_STATUS
+                   and not self.is_prepared(pkg)]
+        with self.lock:
+            attempts = dict(self.state['attempts'])
+        pending.sort(key=lambda pkg: (attempts.get(pkg['dataName'], 0),
+                                      pkg.get('dataStatus') != self.CURRENT_STATUS,
+                                      self.effective_time(pkg) or 0))
+        return pending
+
+    def retry_packages(self, packages):
+        """已准备但有航图下载失败、且未超过重试轮数的非过期版本"""
+        retry = []
+        with self.lock:
+            for pkg in packages:
+                prepared = self.state['prepared'].get(pkg.get('dataName'))
+                if prepared and prepared.get('failed') and pkg.get('dataStatus') != self.EXPIRED_STATUS \
+                        and prepared.get('retries', 0) < self.MAX_RETRIES:
+                    retry.append(pkg)
+        return retry
+
+    @staticmethod
+    def failed_urls(manifest, package_info):
+        return [url for _, url in manifest.tasks(package_info, states=('failed',))]
+
+    def prepare(self, package_info, base_package=None):
+        """准备一个版本：目录与快照、过滤写入清单、与基准版本对比、同步航图，可选生成航图包
+
+        在后台线程中运行，使用独立的SQLite连接。返回准备结果字典，其中failed为下载失败的航图URL；
+        目录获取失败时返回None。
+        """
+        name = package_info.get('dataName', 'unknown')
+        print(f"\n开始准备版本 {name}...")
+        start = time.monotonic()
+        rules = FilterRules.from_config(self.login.config)
+        catalog = PackageCatalog(self.login)
+        manifest = ChartManifest.from_config(self.login)
+        try:
+            tree = catalog.load_tree(package_info, rules, manifest=manifest)
+            if not tree:
+                print(f"获取 {name} 目录失败，稍后重试")
+                return None
+            AipFilter.filter_content(tree, package_info, rules, save_paths=False, manifest=manifest)
+
+            result = {'prepared_at': time.time()}
+            if base_package and base_package.get('dataName') != name:
+                base_tree = catalog.load_tree(base_package, rules)
+                if base_tree:
+                    diff = AipDiff(base_tree, tree, base_package, package_info)
+                    diff.compare()
+                    diff.print_summary()
+                    changeset = os.path.join(self.login.base_dir, f"changeset_{name}.json")
+                    diff.save(changeset)
+                    result['changeset'] = changeset
+
+            downloader = ChartDownloader(self.login, output_dir=self.output_dir, manifest=manifest)
+            download_func = None
+            if self.prefetch:
+                scheduler = PrefetchScheduler.from_config(self.login, downloader)
+                download_func = lambda items: scheduler.run(items, package_info)
+            urls = {url for _, url in manifest.tasks(package_info)}
+            charts = AiracSync.charts_from_aip(tree, package_info, urls)
+            AiracSync(downloader).sync(charts, download_func)
+            result['failed'] = self.failed_urls(manifest, package_info)
+            if result['failed']:
+                print(f"版本 {name} 有 {len(result['failed'])} 个航图下载失败，空闲时重试")
+            result['charts_dir'] = os.path.join(
+                downloader.output_dir, *normalize_url(package_info['filePath']).split('/'))
+
+            if self.export_pack:
+                pack_dir = os.path.join(self.login.base_dir, 'packs')
+                os.makedirs(pack_dir, exist_ok=True)
+                result['pack'] = os.path.join(pack_dir, f"{name}.pack")
+                ChartPack.build(result['pack'], manifest, package_info, downloader)
+        finally:
+            manifest.close()
+
+        metrics.observe('eaip_watch_prepare_seconds', time.monotonic() - start)
+        print(f"版本 {name} 已准备完成，用时 {time.monotonic() - start:.1f} 秒")
+        return result
+
+    def retry_failed(self, package_info):
+        """只重新下载该版本中失败的航图，返回仍然失败的URL列表"""
+        name = package_info.get('dataName', 'unknown')
+        manifest = ChartManifest.from_config(self.login)
+        try:
+            tasks = list(manifest.tasks(package_info, states=('failed',)))
+            print(f"\n重试版本 {name} 下载失败的 {len(tasks)} 个航图...")
+            downloader = ChartDownloader(self.login, output_dir=self.output_dir, manifest=manifest)
+            downloader.download_all(tasks)
+            return self.failed_urls(manifest, package_info)
+        finally:
+            manifest.close()
+
+    def _prepare_in_background(self, package_info, base_package):
+        name = package_info['dataName']
+        try:
+            result = self.prepare(package_info, base_package)
+        except Exception as e:
+            print(f"准备版本 {name} 失败: {str(e)}")
+            result = None
+        with self.lock:
+            if result is not None:
+                self.state['prepared'][name] = result
+                self.state['attempts'].pop(name, None)
+            else:
+                self.state['attempts'][name] = self.state['attempts'].get(name, 0) + 1
+        self._save_state()
+
+    def _retry_in_background(self, package_info):
+        name = package_info['dataName']
+        try:
+            failed = self.retry_failed(package_info)
+        except Exception as e:
+            print(f"重试版本 {name} 失败: {str(e)}")
+            failed = None
+        with self.lock:
+            prepared = self.state['prepared'][name]
+            prepared['retries'] = prepared.get('retries', 0) + 1
+            if failed is not None:
+                prepared['failed'] = failed
+            if prepared['failed'] and prepared['retries'] >= self.MAX_RETRIES:
+                print(f"版本 {name} 仍有 {len(prepared['failed'])} 个航图下载失败，已停止自动重试")
+        self._save_state()
+
+    def switch(self, package_info):
+        """原子切换当前版本指针，返回是否发生了切换"""
+        pointer = self.current_pointer() or {}
+        name = package_info.get('dataName')
+        if pointer.get('dataName') == name:
+            return False
+        with self.lock:
+            prepared = dict(self.state['prepared'].get(name) or {})
+        data = {
+            'dataName': name,
+            'filePath': package_info.get('filePath'),
+            'dataStatus': package_info.get('dataStatus'),
+            'effectiveTime': package_info.get('effectiveTime'),
+            'switched_at': time.time(),
+            'previous': pointer.get('dataName'),
+        }
+        data.update({key: prepared[key] for key in ('charts_dir', 'pack', 'changeset') if key in prepared})
+        write_json(self.pointer_path, data, indent=2)
+        metrics.inc('eaip_watch_switches_total')
+        print(f"已切换当前版本: {pointer.get('dataName') or '无'} -> {name}")
+        return True
+
+    def poll(self):
+        """执行一次轮询，返回package列表，失败时返回None"""
+        try:
+            packages = self.catalog.list_packages(refresh=True)
+        except Exception as e:
+            print(f"轮询package列表失败: {str(e)}")
+            return None
+        return packages or None
+
+    def run_once(self, now=None):
+        """轮询一次并处理变化、准备和切换，返回下次轮询前的等待秒数"""
+        packages = self.poll()
+        if packages is None:
+            self.failures += 1
+            delay = min(self.max_interval, self.interval * (2 ** self.failures))
+            return random.uniform(delay / 2, delay)
+        self.failures = 0
+
+        changed = self.detect_changes(packages)
+        self._save_state()
+        # 没有变化时逐步放宽轮询间隔，有变化时恢复
+        self.delay = self.interval if changed else min(self.max_interval, self.delay * 1.5)
+
+        target = self.target_package(packages, now)
+        if self.worker is None or not self.worker.is_alive():
+            pending = self.pending_packages(packages)
+            if pending:
+                pointer = self.current_pointer()
+                base = target if target is not None and target is not pending[0] else None
+                if base is None and pointer:
+                    base = next((pkg for pkg in packages if pkg.get('dataName') == pointer.get('dataName')), None)
+                self.worker = threading.Thread(target=self._prepare_in_background,
+                                               args=(pending[0], base), daemon=True)
+                self.worker.start()
+            else:
+                retry = self.retry_packages(packages)
+                if retry:
+                    self.worker = threading.Thread(target=self._retry_in_background, args=(retry[0],), daemon=True)
+                    self.worker.start()
+
+        if target is not None and self.is_prepared(target):
+            self.switch(target)
+
+        # 有已准备好但未生效的版本时，在生效时间到达后立即醒来
+        now = time.time() if now is None else now
+        delay = self.delay
+        for pkg in packages:
+            effective = self.effective_time(pkg)
+            if effective is not None and effective > now and pkg.get('dataStatus') != self.EXPIRED_STATUS:
+                delay = min(delay, max(1.0, effective - now))
+        if self.worker is not None and self.worker.is_alive():
+            delay = min(delay, self.interval)
+        return delay
+
+    def run(self):
+        """持续运行直到Ctrl+C"""
+        print(f"开始监视package列表，轮询间隔 {self.interval:.0f}-{self.max_interval:.0f} 秒，"
+              f"当前版本指针: {self.pointer_path}")
+        try:
+            while True:
+                delay = self.run_once()
+                # 准备线程完成后尽快检查是否可以切换
+                deadline = time.monotonic() + delay
+                while time.monotonic() < deadline:
+                    worker = self.worker
+                    if worker is not None and worker.is_alive():
+                        worker.join(min(5.0, max(0.0, deadline - time.monotonic())))
+                        if not worker.is_alive():
+                            break
+                    else:
+                        time.sleep(min(5.0, max(0.0, deadline - time.monotonic())))
+        except KeyboardInterrupt:
+            print("监视已停止")
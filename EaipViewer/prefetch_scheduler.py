@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import queue
+import re
+import threading
+from aip_index import AipIndex
+from chart_downloader import DownloadStats
+from instrumentation import metrics
+
+
+class PrefetchScheduler:
+    """按优先级预取航图：重点机场先下载，其余航图在后台用少量线程补齐
+
+    优先级依次为：是否重点机场（config.ini [prefetch] airports）、是否标记修改、
+    航图类型（默认 IAC/SID/STAR 优先于 APDC/ADC 等，机场文字资料最后）、重点机场的配置顺序。
+    任务放在优先队列中，全部线程都可以领取重点任务；重点任务未完成时后台任务最多由 background_workers
+    个线程领取，不会挤占重点航图的带宽；重点任务全部完成后所有线程一起下载剩余的后台任务。
+    """
+
+    DEFAULT_CHART_TYPES = ('IAC', 'SID', 'STAR', 'APDC', 'ADC')
+    # 航图名称形如 "ZBAA-20A:IAC RNAV ILS/DME z RWY01"，冒号后的第一个词为类型
+    CHART_TYPE_PATTERN = re.compile(r':\s*([A-Z]+)')
+
+    def __init__(self, downloader, airports=(), chart_types=DEFAULT_CHART_TYPES, background_workers=2):
+        self.downloader = downloader
+        self.airports = {icao.upper(): rank for rank, icao in enumerate(airports)}
+        self.chart_types = {kind.upper(): rank for rank, kind in enumerate(chart_types)}
+        self.workers = max(1, downloader.workers)
+        self.background_workers = max(1, min(background_workers, self.workers))
+        self.progress_interval = downloader.progress_interval
+
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)  # 重点任务全部完成时通知等待的线程
+        self.heap = []
+        self.counter = itertools.count()
+        self.critical_left = 0
+
+    @classmethod
+    def from_config(cls, login, downloader):
+        config = login.config
+
+        def split(value):
+            return [part.strip() for part in value.split(',') if part.strip()]
+        return cls(
+            downloader,
+            airports=split(config.get('prefetch', 'airports', fallback='')),
+            chart_types=split(config.get('prefetch', 'chart_types', fallback='')) or cls.DEFAULT_CHART_TYPES,
+            background_workers=config.getint('prefetch', 'background_workers', fallback=2),
+        )
+
+    @classmethod
+    def chart_type(cls, name):
+        """航图类型（IAC、SID、ADC等），非航图节点返回None"""
+        if not AipIndex.chart_code({'name_cn': name}):
+            return None
+        match = cls.CHART_TYPE_PATTERN.search(name or '')
+        return match.group(1) if match else None
+
+    def priority(self, name, icao=None, modified=False):
+        """返回 (是否后台任务, 排序键)，排序键越小越先下载"""
+        if not icao:
+            code = AipIndex.chart_code({'name_cn': name})
+            icao = code.split('-')[0] if code else None
+        airport_rank = self.airports.get((icao or '').upper())
+        background = airport_rank is None
+        kind = self.chart_type(name)
+        if kind is None:
+            type_rank = len(self.chart_types) + 1   # 文字资料
+        else:
+            type_rank = self.chart_types.get(kind, len(self.chart_types))
+        return background, (background, not modified, type_rank, airport_rank or 0)
+
+    def plan(self, tasks, package_info=None):
+        """为 (名称, URL) 任务计算优先级；清单可用时从中读取ICAO和修改标记
+
+        返回按下载顺序排列的 (排序键, 是否后台任务, 名称, URL) 列表。
+        """
+        info = {}
+        manifest = self.downloader.manifest
+        if manifest is not None and package_info:
+            for row in manifest.rows(package_info):
+                known = info.get(row['url'])
+                if known is None:
+                    info[row['url']] = (row['icao'], bool(row['modified']))
+                else:
+                    info[row['url']] = (known[0] or row['icao'], known[1] or bool(row['modified']))
+
+        planned = []
+        for name, url in tasks:
+            icao, modified = info.get(url, (None, False))
+            background, key = self.priority(name, icao, modified)
+            planned.append((key, background, name, url))
+        planned.sort(key=lambda item: item[0])
+        return planned
+
+    def _push(self, key, background, name, url):
+        heapq.heappush(self.heap, (key, next(self.counter), background, name, url))
+
+    def _take(self, may_background):
+        """领取优先级最高的任务，队列为空时返回None
+
+        不能领取后台任务的线程在队首为后台任务时等待，直到重点任务全部完成。
+        """
+        with self.ready:
+            while self.heap and not (may_background or not self.heap[0][2] or self.critical_left == 0):
+                self.ready.wait()
+            if not self.heap:
+                return None
+            _, _, background, name, url = heapq.heappop(self.heap)
+            return background, name, url
+
+    def _worker(self, may_background, results):
+        while True:
+            task = self._take(may_background)
+            if task is None:
+                return
+            background, name, url = task
+            try:
+                status, size = self.downloader.download_one(name, url)
+            finally:
+                if not background:
+                    with self.ready:
+                        self.critical_left -= 1
+                        if self.critical_left == 0:
+                            self.ready.notify_all()
+            results.put((background, url, status, size))
+
+    def run(self, tasks, package_info=None):
+        """按优先级下载全部任务，返回统计信息（结果在调用线程中写回清单）"""
+        stats = DownloadStats()
+        planned = self.plan(tasks, package_info)
+        if not planned:
+            print("没有需要下载的航图")
+            return stats.summary()
+
+        critical_total = sum(1 for _, background, _, _ in planned if not background)
+        with self.lock:
+            for key, background, name, url in planned:
+                self._push(key, background, name, url)
+            self.critical_left = critical_total
+        print(f"开始预取 {len(planned)} 个航图：重点 {critical_total}，后台 {len(planned) - critical_total}，"
+              f"线程数: {self.workers}（后台 {self.background_workers}）")
+
+        results = queue.Queue()
+        threads = [threading.Thread(target=self._worker, args=(i < self.background_workers, results), daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        critical_done = 0
+        critical_stats = {'completed': 0, 'skipped': 0, 'failed': 0}
+        for done in range(1, len(planned) + 1):
+            background, url, status, size = results.get()
+            stats.add(status, size)
+            self.downloader.record(url, status)
+            if not background:
+                critical_done += 1
+                critical_stats[{'ok': 'completed', 'skipped': 'skipped'}.get(status, 'failed')] += 1
+                if critical_done == critical_total:
+                    metrics.observe('eaip_prefetch_critical_seconds', stats.elapsed)
+                    print(f"重点航图已就绪，用时 {stats.elapsed:.1f} 秒: 完成 {critical_stats['completed']}，"
+                          f"跳过 {critical_stats['skipped']}，失败 {critical_stats['failed']}")
+                    if self.downloader.manifest is not None:
+                        self.downloader.manifest.commit()
+            if done % self.progress_interval == 0:
+                print(f"进度 {done}/{len(planned)}: {stats.report()}")
+        for thread in threads:
+            thread.join()
+        if self.downloader.manifest is not None:
+            self.downloader.manifest.commit()
+
+        print(f"预取结束: {stats.report()}")
+        return stats.summary()